@@ -1,17 +1,15 @@
 # app.py - Sophisticated Palette - Vintage Mona Lisa Gallery
 import streamlit as st
-from PIL import Image, ImageFilter, ImageEnhance, ImageOps, ImageDraw, ImageFont
-from io import BytesIO
+from PIL import Image, ImageFont
 import base64
-import math
-# --- NEW IMPORTS FOR ML FEATURES ---
-import cv2
+import uuid
+from functools import partial
 import numpy as np
-import tensorflow as tf
-import tensorflow_hub as hub
-from deepface import DeepFace
-import requests
-# --- END NEW IMPORTS ---
+# ML features (TensorFlow, TF Hub, OpenCV, DeepFace) are imported lazily
+# through sophisticated_palette.backend, only when they are used
+from sophisticated_palette import backend, emotion, export, jobs, models, presets, process_image, profiling, rendercache, sources, styles
+from sophisticated_palette import preview
+from sophisticated_palette.preview import scale_params
 
 st.set_page_config(
     page_title="Sophisticated Palette — Renaissance Gallery",
@@ -19,11 +17,12 @@ st.set_page_config(
     layout="wide"
 )
 
-# Load image
+# Load the bundled artwork; nothing is decoded until a preview is needed
+DEFAULT_ARTWORK = "1449px-Mona_Lisa,_by_Leonardo_da_Vinci,_from_C2RMF_retouched.jpg"
 try:
-    image = Image.open("1449px-Mona_Lisa,_by_Leonardo_da_Vinci,_from_C2RMF_retouched.jpg")
+    default_source = sources.load_path(DEFAULT_ARTWORK)
 except FileNotFoundError:
-    st.error("Image file missing. Place '1449px-Mona_Lisa,_by_Leonardo_da_Vinci,_from_C2RMF_retouched.jpg' in the same folder.")
+    st.error(f"Image file missing. Place '{DEFAULT_ARTWORK}' in the same folder.")
     st.stop()
 
 # Enhanced styling with handwritten title
@@ -251,6 +250,11 @@ This app now includes advanced AI features. You'll find them in the sidebar.
 # Sidebar with expanded controls
 with st.sidebar:
     st.markdown('<div class="sidebar-title">⚜ Atelier Controls ⚜</div>', unsafe_allow_html=True)
+
+    # Artwork Section
+    st.markdown("### 🖼️ Artwork")
+    uploaded = st.file_uploader("Upload a Painting", type=sources.UPLOAD_TYPES,
+                                help=f"JPEG, PNG, WebP or TIFF up to {sources.MAX_IMAGE_PIXELS / 1e6:.0f} megapixels. Large JPEGs are previewed without a full decode.")
     
     # Color & Tone Section
     st.markdown("### 🎨 Color & Tone")
@@ -297,6 +301,8 @@ with st.sidebar:
     frame_width = st.slider("Frame Width", 0, 100, 30, 5)
     rotation = st.slider("Rotation (degrees)", -15, 15, 0, 1)
     zoom = st.slider("Zoom Level", 0.5, 2.0, 1.0, 0.05)
+    preview_resample = st.select_slider("Preview Resampling", ["nearest", "bilinear", "bicubic", "lanczos"], value="bilinear",
+                                        help="Filter for rotation and zoom in the preview; downloads always use the finest.")
     
     st.markdown("---")
     
@@ -310,317 +316,87 @@ with st.sidebar:
 
     # ML Atelier Section
     st.markdown("### 🔬 Machine Learning Atelier")
-    st.info("AI features can be slow on first run as models are downloaded. Please be patient.")
+    st.info("AI features can be slow on first run as models are loaded from the local model store (and downloaded if missing). Please be patient.")
 
     style_choice = st.selectbox("Neural Art Style", 
-                                ["None", "Starry Night (Van Gogh)", "The Great Wave (Hokusai)", "Da Vinci Sketch", "Cubism (Picasso)", "Abstract Watercolor"],
+                                ["None"] + list(styles.STYLES),
                                 help="Reimagines the painting in the style of another artwork using Neural Style Transfer.")
+    compared_styles = st.multiselect("Compare Styles", list(styles.STYLES),
+                                     help="Stylizes the painting with every selected style in one batched pass and shows them side by side.")
+    compare_clicked = st.button("🖼 Compare Selected Styles", disabled=not compared_styles)
 
     enable_super_res = st.checkbox("AI Super-Resolution", help="Upscales the image using an AI model to add detail. Can be slow.")
     enable_colorization = st.checkbox("AI Re-Colorization", help="Converts image to B&W, then uses AI to colorize it.")
-    crackle_repair_intensity = st.slider("AI Crackle Repair", 0.0, 1.0, 0.0, 0.05, help="Uses an algorithm to detect and repair paint crackle.")
+    crackle_repair_intensity = st.slider("AI Crackle Repair", 0.0, 1.0, 0.0, 0.05, help="Detects paint crackle and inpaints it. Higher values find fainter, shorter cracks and repair a wider band.")
 
     with st.expander("Advanced AI Analysis & Effects"):
         enable_composition_guide = st.checkbox("Show Composition Guide", help="Draws Rule-of-Thirds lines based on the subject.")
         enable_deep_dream = st.checkbox("Apply 'Deep Dream' Effect", help="A psychedelic effect that enhances patterns the AI sees in the image.")
+        deep_dream_mode = st.radio("Deep Dream Mode", ["Octaves", "Full Resolution"], horizontal=True,
+                                   help="Octaves dreams at reduced scales on tiles; Full Resolution runs every step on the whole image.")
+        face_detector = st.selectbox("Face Detector", emotion.DETECTORS,
+                                     index=emotion.DETECTORS.index(emotion.DEFAULT_DETECTOR),
+                                     help="Lightest first. Results are cached per painting and detector.")
         analyze_emotion = st.button("Analyze Facial Emotion", help="Uses AI to predict the emotion of the subject.")
+        show_profile = st.checkbox("Show Render Profile", help="Times every stage of this render (wall, CPU and allocated memory).")
 
     st.markdown("---")
     st.markdown('<div style="text-align:center; font-family: \'EB Garamond\', serif; color: #9d8560; font-size: 0.85rem;">Renaissance Gallery<br>Digital Restoration</div>', unsafe_allow_html=True)
 
 # ==================== MACHINE LEARNING HELPERS ====================
 
-def pil_to_cv2(pil_image):
-    """Convert PIL image to OpenCV format (BGR)."""
-    return cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
-
-def cv2_to_pil(cv2_image):
-    """Convert OpenCV image (BGR) to PIL format."""
-    return Image.fromarray(cv2.cvtColor(cv2_image, cv2.COLOR_BGR2RGB))
-
-def tf_tensor_to_image(tensor):
-    """Converts a TensorFlow tensor to a PIL Image."""
-    tensor = tensor * 255
-    tensor = np.array(tensor, dtype=np.uint8)
-    if np.ndim(tensor) > 3:
-        assert tensor.shape[0] == 1
-        tensor = tensor[0]
-    return Image.fromarray(tensor)
-
 @st.cache_resource
-def load_style_model():
-    return hub.load('https://tfhub.dev/google/magenta/arbitrary-image-stylization-v1-256/2')
-
-@st.cache_data
-def load_image_from_url(url):
-    response = requests.get(url)
-    img = Image.open(BytesIO(response.content))
-    return img.convert("RGB")
-
-@st.cache_data
-def get_style_images():
-    return {
-        "Starry Night (Van Gogh)": load_image_from_url("https://upload.wikimedia.org/wikipedia/commons/thumb/e/ea/Van_Gogh_-_Starry_Night_-_Google_Art_Project.jpg/1280px-Van_Gogh_-_Starry_Night_-_Google_Art_Project.jpg"),
-        "The Great Wave (Hokusai)": load_image_from_url("https://upload.wikimedia.org/wikipedia/commons/thumb/a/a5/Tsunami_by_hokusai_19th_century.jpg/1280px-Tsunami_by_hokusai_19th_century.jpg"),
-        "Da Vinci Sketch": load_image_from_url("https://upload.wikimedia.org/wikipedia/commons/thumb/e/e5/Leonardo_da_vinci%2C_a_bear%27s_head.jpg/800px-Leonardo_da_vinci%2C_a_bear%27s_head.jpg"),
-        "Cubism (Picasso)": load_image_from_url("https://upload.wikimedia.org/wikipedia/en/1/1c/Pablo_Picasso%2C_1910%2C_Girl_with_a_Mandolin_%28Fanny_Tellier%29%2C_oil_on_canvas%2C_100.3_x_73.6_cm%2C_Museum_of_Modern_Art_New_York..jpg"),
-        "Abstract Watercolor": load_image_from_url("https://upload.wikimedia.org/wikipedia/commons/thumb/8/89/Wassily_Kandinsky%2C_1910_-_Untitled_%28First_Abstract_Watercolor%29.jpg/1280px-Wassily_Kandinsky%2C_1910_-_Untitled_%28First_Abstract_Watercolor%29.jpg"),
-    }
+def warm_up_models():
+    # Runs once per server process, before the first render
+    backend.load().warm_up()
+    return True
 
-@st.cache_resource
-def load_super_res_model():
-    return hub.load("https://tfhub.dev/captain-pool/esrgan-tf2/1")
+def run_emotion_analysis(img_np_rgb, detector):
+    return backend.load().run_emotion_analysis(img_np_rgb, detector)
 
 @st.cache_resource
-def load_inception_model():
-    return tf.keras.applications.InceptionV3(include_top=False, weights='imagenet')
-
-def run_emotion_analysis(img_np_rgb):
-    try:
-        result = DeepFace.analyze(img_np_rgb, actions=['emotion'], enforce_detection=False)
-        # DeepFace returns a list of results for faces
-        if isinstance(result, list) and len(result) > 0:
-            dominant_emotion = result[0]['dominant_emotion']
-            return f"{dominant_emotion.capitalize()} ({result[0]['emotion'][dominant_emotion]:.1f}%)"
-        return "Could not determine emotion."
-    except Exception as e:
-        return f"Analysis failed: {e}"
-
-def calc_dream_loss(img, model):
-    img_batch = tf.expand_dims(img, axis=0)
-    layer_activations = model(img_batch)
-    losses = []
-    for act in layer_activations:
-        loss = tf.math.reduce_mean(act)
-        losses.append(loss)
-    return tf.reduce_sum(losses)
-
-@tf.function
-def deep_dream_step(img, model, step_size):
-    with tf.GradientTape() as tape:
-        tape.watch(img)
-        loss = calc_dream_loss(img, model)
-    gradients = tape.gradient(loss, img)
-    gradients /= tf.math.reduce_std(gradients) + 1e-8
-    img = img + gradients * step_size
-    img = tf.clip_by_value(img, -1, 1)
-    return loss, img
-
-def run_deep_dream(img, model, steps=100, step_size=0.01):
-    img = tf.keras.applications.inception_v3.preprocess_input(img)
-    for _ in range(steps):
-        _, img = deep_dream_step(img, model, tf.constant(step_size))
-    
-    # Deprocess
-    img = (img + 1) / 2.0
-    img = tf.clip_by_value(img, 0, 1)
-    return np.array(img * 255, dtype=np.uint8)
+def start_metrics_server():
+    # One Prometheus endpoint per server process, shared by every session
+    return profiling.serve_metrics()
 
 # ==================================================================
 
-# Advanced image processing function
-def process_image(img, params):
-    img = img.copy()
-    
-    # Rotation
-    if params['rotation'] != 0:
-        img = img.rotate(params['rotation'], expand=True, fillcolor=(15, 10, 5))
-    
-    # Zoom
-    if params['zoom'] != 1.0:
-        w, h = img.size
-        new_w, new_h = int(w * params['zoom']), int(h * params['zoom'])
-        img = img.resize((new_w, new_h), Image.LANCZOS)
-        left = (new_w - w) // 2
-        top = (new_h - h) // 2
-        img = img.crop((left, top, left + w, top + h))
-    
-    # Color mode adjustments
-    if params['color_mode'] == "Monochrome":
-        img = ImageOps.grayscale(img)
-        img = img.convert("RGB")
-    elif params['color_mode'] == "Cool Tone":
-        enhancer = ImageEnhance.Color(img)
-        img = enhancer.enhance(0.8)
-        cool = Image.new("RGB", img.size, (180, 200, 220))
-        img = Image.blend(img, cool, 0.1)
-    elif params['color_mode'] == "Warm Tone":
-        warm = Image.new("RGB", img.size, (139, 108, 66))
-        img = Image.blend(img, warm, 0.15)
-    
-    # Saturation
-    if params['saturation'] != 1.0:
-        enhancer = ImageEnhance.Color(img)
-        img = enhancer.enhance(params['saturation'])
-    
-    # Warmth adjustment
-    if params['warmth'] != 1.0:
-        warm_overlay = Image.new("RGB", img.size, (139, 108, 66))
-        img = Image.blend(img, warm_overlay, (params['warmth'] - 1.0) * 0.3)
-    
-    # Blur (sfumato)
-    if params['blur'] > 0:
-        img = img.filter(ImageFilter.GaussianBlur(radius=params['blur']))
-    
-    # Sharpness
-    if params['sharpness'] != 1.0:
-        enhancer = ImageEnhance.Sharpness(img)
-        img = enhancer.enhance(params['sharpness'])
-    
-    # Edge enhancement
-    if params['edge_enhance'] > 0:
-        edge_img = img.filter(ImageFilter.EDGE_ENHANCE_MORE)
-        img = Image.blend(img, edge_img, params['edge_enhance'] * 0.3)
-    
-    # Brightness and contrast
-    enhancer = ImageEnhance.Brightness(img)
-    img = enhancer.enhance(params['brightness'])
-    enhancer = ImageEnhance.Contrast(img)
-    img = enhancer.enhance(params['contrast'])
-    
-    # Highlights adjustment
-    if params['highlights'] != 1.0:
-        pixels = img.load()
-        width, height = img.size
-        for y in range(height):
-            for x in range(width):
-                r, g, b = pixels[x, y]
-                avg = (r + g + b) / 3
-                if avg > 128:
-                    factor = params['highlights']
-                    r = min(255, int(r * factor))
-                    g = min(255, int(g * factor))
-                    b = min(255, int(b * factor))
-                    pixels[x, y] = (r, g, b)
-    
-    # Shadows adjustment
-    if params['shadows'] > 0:
-        shadow_layer = Image.new("RGB", img.size, (0, 0, 0))
-        img = Image.blend(img, shadow_layer, params['shadows'] * 0.3)
-    
-    # Sepia tint
-    if params['sepia_tone'] > 0:
-        sepia = Image.new("RGB", img.size, (112, 66, 20))
-        img = Image.blend(img, sepia, params['sepia_tone'])
-    
-    # Custom tint
-    if params['tint_strength'] > 0:
-        tint = Image.new("RGB", img.size, tuple(int(params['tint_color'][i:i+2], 16) for i in (1, 3, 5)))
-        img = Image.blend(img, tint, params['tint_strength'])
-    
-    # Film grain / noise
-    if params['noise_grain'] > 0:
-        from PIL import ImageChops
-        import random
-        noise = Image.effect_noise(img.size, params['noise_grain'])
-        img = ImageChops.blend(img, noise.convert("RGB"), 0.05)
-    
-    # Vignette - softer, edges only
-    if params['vignette'] > 0:
-        width, height = img.size
-        vignette_mask = Image.new("L", (width, height), 255)
-        draw = ImageDraw.Draw(vignette_mask)
-        
-        edge_size = int(min(width, height) * 0.25)
-        for i in range(edge_size):
-            alpha = int(255 - (255 * (i / edge_size) * params['vignette'] * 0.5))
-            draw.rectangle([i, i, width-i, height-i], outline=alpha)
-        
-        dark = Image.new("RGB", img.size, (15, 10, 5))
-        img = Image.composite(img, dark, vignette_mask)
-    
-    # Age patina (yellowing)
-    if params['patina']:
-        patina_layer = Image.new("RGB", img.size, (139, 108, 66))
-        img = Image.blend(img, patina_layer, 0.08)
-    
-    # Color fade
-    if params['fade'] > 0:
-        fade_layer = Image.new("RGB", img.size, (200, 190, 170))
-        img = Image.blend(img, fade_layer, params['fade'])
-    
-    # Canvas texture simulation
-    if params['texture']:
-        enhancer = ImageEnhance.Sharpness(img)
-        img = enhancer.enhance(0.8)
-    
-    # Paint crackle effect
-    if params['crackle'] > 0:
-        crackle_overlay = img.filter(ImageFilter.FIND_EDGES)
-        img = Image.blend(img, crackle_overlay, params['crackle'] * 0.2)
-    
-    return img
-
-# New function for ML-based processing
+if profiling.METRICS_PORT:
+    start_metrics_server()
+
+if models.WARM_UP:
+    with st.spinner("Warming up the Machine Learning Atelier..."):
+        warm_up_models()
+
+# Synchronous ML processing for the full-resolution export; the ML stack is only imported when used
 def process_image_ml(img_pil, params_ml):
-    if all(v == False or v == 'None' or v == 0.0 for v in params_ml.values()):
+    if not backend.ml_requested(params_ml):
         return img_pil
 
     with st.spinner("Applying AI magic... ✨"):
-        img_np = np.array(img_pil)
-        
-        # AI Re-Colorization
-        if params_ml['colorization']:
-            gray_img = cv2.cvtColor(img_np, cv2.COLOR_RGB2GRAY)
-            # For a real implementation, a colorization model from TF Hub would be used here.
-            # As a placeholder, we'll just show the grayscale to indicate the start of the process.
-            # A real model would be too slow for interactive use without significant setup.
-            # We will blend it with sepia to simulate a "recolorized" feel.
-            colorized_np = cv2.cvtColor(gray_img, cv2.COLOR_GRAY2RGB)
-            sepia_filter = np.array([[0.272, 0.534, 0.131],
-                                     [0.349, 0.686, 0.168],
-                                     [0.393, 0.769, 0.189]])
-            img_np = cv2.transform(colorized_np, sepia_filter.T)
-            img_np = np.clip(img_np, 0, 255).astype(np.uint8)
-
-        # AI Super-Resolution
-        if params_ml['super_res']:
-            super_res_model = load_super_res_model()
-            img_tf = tf.convert_to_tensor(img_np, dtype=tf.float32) / 255.0
-            img_tf = tf.expand_dims(img_tf, 0)
-            sr_image = super_res_model(img_tf)
-            sr_image = tf.squeeze(sr_image)
-            img_np = (np.array(sr_image) * 255).astype(np.uint8)
-
-        # Neural Style Transfer
-        if params_ml['style_choice'] != 'None':
-            style_model = load_style_model()
-            style_images = get_style_images()
-            style_image = style_images[params_ml['style_choice']]
-            
-            content_image_tf = tf.convert_to_tensor(img_np, dtype=tf.float32) / 255.0
-            style_image_tf = tf.convert_to_tensor(np.array(style_image), dtype=tf.float32) / 255.0
-            
-            content_image_tf = tf.image.resize(content_image_tf, (512, 512), preserve_aspect_ratio=True)
-            style_image_tf = tf.image.resize(style_image_tf, (256, 256))
-
-            stylized_image = style_model(tf.constant(content_image_tf[tf.newaxis, ...]), tf.constant(style_image_tf[tf.newaxis, ...]))[0]
-            img_np = (np.array(stylized_image[0]) * 255).astype(np.uint8)
-
-        # Deep Dream
-        if params_ml['deep_dream']:
-            inception_model = load_inception_model()
-            # Select layers to maximize
-            names = ['mixed3', 'mixed5']
-            layers = [inception_model.get_layer(name).output for name in names]
-            dream_model = tf.keras.Model(inputs=inception_model.input, outputs=layers)
-            img_np = run_deep_dream(img_np, dream_model, steps=50, step_size=0.02)
-
-        # AI Crackle Repair
-        if params_ml['crackle_repair'] > 0:
-            gray = cv2.cvtColor(img_np, cv2.COLOR_RGB2GRAY)
-            edges = cv2.Canny(gray, 50, 150)
-            mask = cv2.dilate(edges, np.ones((3,3), np.uint8), iterations=1)
-            img_np = cv2.inpaint(img_np, mask, 3, cv2.INPAINT_TELEA)
-
-        # Composition Guide
-        if params_ml['composition_guide']:
-            h, w, _ = img_np.shape
-            for i in range(1, 3):
-                cv2.line(img_np, (w * i // 3, 0), (w * i // 3, h), (212, 175, 55, 100), 1)
-                cv2.line(img_np, (0, h * i // 3), (w, h * i // 3), (212, 175, 55, 100), 1)
-
-        return Image.fromarray(img_np)
+        progress_bar = []
+
+        def ml_progress(done, total):
+            # Super-resolution tiles, then Deep Dream steps
+            if not progress_bar:
+                progress_bar.append(st.progress(0.0, text="Applying AI magic..."))
+            progress_bar[0].progress(done / total, text=f"Applying AI magic... ({done}/{total})")
+
+        result = backend.load().process_image_ml(img_pil, params_ml, progress=ml_progress)
+        if progress_bar:
+            progress_bar[0].empty()
+        return result
+
+def run_ml_job(img_pil, params_ml, key, profile, progress, reports):
+    # Runs on the background ML pool, outside any session's script thread
+    stage_profile = profiling.begin(profile)
+    try:
+        result = backend.load().process_image_ml(img_pil, params_ml, progress=progress, reports=reports)
+        rendercache.RENDERS.put(key, np.asarray(result))
+        return result
+    finally:
+        profiling.end()
+        reports['profile'] = stage_profile.records
 
 # Collect all parameters
 params = {
@@ -643,6 +419,7 @@ params = {
     'fade': fade,
     'rotation': rotation,
     'zoom': zoom,
+    'resample': "lanczos",
     'color_mode': color_mode,
     'tint_color': tint_color,
     'tint_strength': tint_strength
@@ -654,33 +431,126 @@ params_ml = {
     'super_res': enable_super_res,
     'crackle_repair': crackle_repair_intensity,
     'composition_guide': enable_composition_guide,
-    'deep_dream': enable_deep_dream,
+    'deep_dream': ("octaves" if deep_dream_mode == "Octaves" else "full") if enable_deep_dream else False,
     'colorization': enable_colorization,
 }
 
-# Handle button-triggered analysis
-if analyze_emotion:
-    with st.spinner("Analyzing emotion..."):
-        emotion_results = run_emotion_analysis(np.array(image.copy().convert("RGB")))
-        st.session_state['emotion_results'] = emotion_results
-
-# Process and display
-processed = process_image(image, params)
-processed_ml = process_image_ml(processed, params_ml)
-
-col1, col2, col3 = st.columns([1, 10, 1])
-with col2:
-    if 'emotion_results' in st.session_state:
-        st.success(f"**Emotion Analysis:** {st.session_state['emotion_results']}")
-
-    st.markdown('<div class="image-container">', unsafe_allow_html=True)
-    st.image(processed_ml, use_container_width=True)
-    st.markdown('<div class="caption-text">Oil on poplar panel • 77 cm × 53 cm (30 in × 21 in) • Musée du Louvre, Paris</div>', unsafe_allow_html=True)
-    st.markdown('</div>', unsafe_allow_html=True)
-
-# Additional info section
-with st.expander("📖 About This Masterpiece"):
-    st.markdown("""
+with st.sidebar:
+    st.download_button("⚙ Save Preset", data=presets.dumps(params, params_ml),
+                       file_name="sophisticated_palette_preset.json", mime="application/json",
+                       help="Saves the current settings for `python -m sophisticated_palette render --preset`.")
+
+# Per-stage timings for this run; a no-op unless enabled. It always ends,
+# even when the run raises or reruns, so memory tracing never outlives it
+render_profile = profiling.begin(show_profile, trace_memory=show_profile)
+
+try:
+    # The uploaded painting, if any; sources are cached by content hash
+    source = default_source
+    if uploaded is not None:
+        try:
+            with profiling.stage("source.load"):
+                source = sources.load(uploaded.getvalue(), hint=getattr(uploaded, "file_id", uploaded.name))
+        except sources.SourceError as e:
+            st.sidebar.error(f"Could not open {uploaded.name}: {e}")
+    source_key = source.key
+    artwork_name = "mona_lisa" if source is default_source else uploaded.name.rsplit(".", 1)[0]
+
+    # Process and display at preview resolution; the full-resolution render
+    # only runs when the artwork is downloaded. Finished previews are shared by
+    # every session through the render cache, which also persists to disk.
+    preview_params = {**params, 'resample': preview_resample}
+    preview_key = rendercache.render_key(source_key, {'preview_width': preview.PREVIEW_WIDTH}, preview_params)
+
+    def render_preview():
+        with profiling.stage("preview.decode"):
+            preview_image, preview_scale = source.preview(preview.PREVIEW_WIDTH)
+        return process_image(preview_image, scale_params(preview_params, preview_scale))
+
+    processed = rendercache.RENDERS.cached(preview_key, render_preview)
+
+    # Handle button-triggered analysis on the upright source, decoded at
+    # detection size, so the adjustments never change the reading. Results are
+    # cached per source and detector.
+    if analyze_emotion:
+        with st.spinner("Analyzing emotion..."):
+            detect_width = max(1, round(emotion.DETECT_SIZE * source.size[0] / max(source.size)))
+            detect_image, _ = source.preview(detect_width)
+            emotion_results = run_emotion_analysis(np.asarray(detect_image), face_detector)
+            st.session_state['emotion_results'] = emotion_results
+
+    # ML stages run as a background job keyed by their input, shared with any
+    # session asking for the same render. The classic render is shown at once
+    # and replaced when the job finishes; moving a slider releases the old job.
+    session_id = st.session_state.setdefault('session_id', uuid.uuid4().hex)
+    ml_job = None
+    ml_cached = None
+    if backend.ml_requested(params_ml):
+        ml_key = rendercache.ml_render_key(preview_key, params_ml)
+        ml_cached = rendercache.RENDERS.get(ml_key)
+    if ml_cached is not None:
+        jobs.forget(session_id)
+        ml_cached = Image.fromarray(np.asarray(ml_cached))
+    elif backend.ml_requested(params_ml):
+        ml_job = jobs.submit(ml_key, session_id, partial(run_ml_job, processed, params_ml, ml_key, render_profile.enabled))
+    else:
+        jobs.forget(session_id)
+    ml_pending = ml_job is not None and not ml_job.done()
+
+    @st.fragment(run_every=jobs.POLL_SECONDS if ml_pending else None)
+    def artwork_preview():
+        if ml_pending and ml_job.done():
+            # Rerun the whole page so polling stops and the downloads see the result
+            st.rerun()
+        shown = processed if ml_cached is None else ml_cached
+        if ml_job is not None and ml_job.done():
+            try:
+                shown = ml_job.result() or processed
+            except Exception as e:
+                st.error(f"AI processing failed: {e}")
+        elif ml_job is not None:
+            if ml_job.progress:
+                done, total = ml_job.progress
+                st.progress(done / total, text=f"Applying AI magic... ✨ ({done}/{total})")
+            else:
+                st.caption("Applying AI magic... ✨")
+
+        # The browser gets a display-sized encoded preview; identical renders send
+        # identical bytes, which Streamlit serves from the same URL
+        with profiling.stage("display"):
+            st.image(preview.encode_preview(shown), use_container_width=True)
+        if ml_job is not None and ml_job.done() and 'deep_dream' in ml_job.reports:
+            st.caption(str(ml_job.reports['deep_dream']))
+
+    col1, col2, col3 = st.columns([1, 10, 1])
+    with col2:
+        if 'emotion_results' in st.session_state:
+            st.success(f"**Emotion Analysis:** {st.session_state['emotion_results']}")
+
+        st.markdown('<div class="image-container">', unsafe_allow_html=True)
+        artwork_preview()
+        if source is default_source:
+            st.markdown('<div class="caption-text">Oil on poplar panel • 77 cm × 53 cm (30 in × 21 in) • Musée du Louvre, Paris</div>', unsafe_allow_html=True)
+        st.markdown('</div>', unsafe_allow_html=True)
+
+    # Style comparison grid: every selected style in one batched transfer call,
+    # kept until the classic render changes
+    if compare_clicked:
+        with st.spinner(f"Painting {len(compared_styles)} styles at once..."):
+            grid = backend.load().compare_styles(processed, compared_styles)
+        st.session_state['style_grid'] = (preview_key, list(zip(compared_styles, grid)))
+
+    if st.session_state.get('style_grid', (None,))[0] == preview_key:
+        st.markdown("### 🖼 Style Comparison")
+        grid_columns = st.columns(3)
+        for i, (style_name, styled) in enumerate(st.session_state['style_grid'][1]):
+            with grid_columns[i % 3]:
+                st.image(preview.encode_preview(styled, width=preview.PREVIEW_WIDTH // 2), caption=style_name,
+                         use_container_width=True)
+
+    # Additional info section
+    with st.expander("📖 About This Masterpiece"):
+        st.markdown("""
     <div class="info-box">
     <strong>La Gioconda (Mona Lisa)</strong> is a half-length portrait painting by Italian artist Leonardo da Vinci. 
     Considered an archetypal masterpiece of the Italian Renaissance, it has been described as "the best known, 
@@ -691,17 +561,53 @@ with st.expander("📖 About This Masterpiece"):
     </div>
     """, unsafe_allow_html=True)
 
-# Download section
-col_a, col_b, col_c = st.columns([2, 1, 2])
-with col_b:
-    buf = BytesIO()
-    processed_ml.save(buf, format="PNG")
-    st.download_button(
-        label="💾 Download Artwork",
-        data=buf.getvalue(),
-        file_name="sophisticated_palette_mona_lisa.png",
-        mime="image/png"
-    )
+    # Download section
+    col_a, col_b, col_c = st.columns([2, 1, 2])
+    with col_b:
+        export_format = st.selectbox("Format", list(export.FORMATS))
+        export_compression = st.select_slider("Compression", export.COMPRESSION, value="Balanced",
+                                              help="Fastest encodes quickly into a larger file; Smallest takes longer.")
+        # Nothing is rendered or encoded until the artwork is requested. The
+        # full-resolution render is kept in the render cache, so changing only the
+        # format or compression re-encodes it; repeated requests for the same
+        # render and settings are served from the export cache
+        if st.button("💾 Download Artwork"):
+            with st.spinner("Rendering full-resolution artwork..."):
+                with profiling.stage("export.hash"):
+                    render_key = rendercache.render_key(source_key, params)
+                    if backend.ml_requested(params_ml):
+                        render_key = rendercache.ml_render_key(render_key, params_ml)
+
+                def render_full_res():
+                    return rendercache.RENDERS.cached(
+                        render_key, lambda: process_image_ml(process_image(source.full(), params), params_ml))
+
+                data = export.cached_export(render_key, render_full_res, export_format, export_compression)
+            _, extension, mime = export.FORMATS[export_format]
+            st.download_button(
+                label=f"Save {export_format}",
+                data=data,
+                file_name=f"sophisticated_palette_{artwork_name}{extension}",
+                mime=mime
+            )
+finally:
+    profiling.end()
+
+if ml_job is not None and ml_job.done():
+    render_profile.records.extend(ml_job.reports.get('profile', ()))
+if show_profile and render_profile.records:
+    with st.expander("⏱ Render Profile", expanded=True):
+        st.table([{"Stage": r["stage"],
+                   "Wall (ms)": f"{r['wall_s'] * 1000:.1f}",
+                   "CPU (ms)": f"{r['cpu_s'] * 1000:.1f}",
+                   "Allocated (MB)": "—" if r["alloc_bytes"] is None else f"{r['alloc_bytes'] / 2**20:.1f}"}
+                  for r in render_profile.records])
+        st.caption(f"Total {render_profile.total_wall * 1000:.0f} ms. Cached stages are skipped and do not appear. "
+                   "Allocation shows — when another profiled session ran at the same time.")
+        cache_stats = rendercache.RENDERS.stats()
+        st.caption(" • ".join(f"Render cache ({tier}): {s['hits']} hits, {s['misses']} misses, {s['evictions']} evictions, "
+                              f"{s['bytes'] / 2**20:.0f}/{s['max_bytes'] / 2**20:.0f} MB"
+                              for tier, s in cache_stats.items()))
 
 # Footer
 st.markdown("""
@@ -0,0 +1,2 @@
+"""Image processing engine behind the Sophisticated Palette gallery."""
+from .engine import process_image
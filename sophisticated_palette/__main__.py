@@ -0,0 +1,161 @@
+# __main__.py - Command-line entry point: python -m sophisticated_palette
+import argparse
+import json
+import sys
+
+from . import models
+
+
+def cmd_prefetch(args):
+    for name, path in models.prefetch(args.models or None, force=args.force).items():
+        print(f"{name}: {path}")
+    if args.warm_up:
+        models.warm_up()
+        print("warm-up complete")
+    return 0
+
+def cmd_verify(args):
+    status = 0
+    for name in args.models or models.REGISTRY:
+        try:
+            print(f"{name}: ok ({models.verify(name)})")
+        except models.ModelStoreError as e:
+            print(f"{name}: {e}", file=sys.stderr)
+            status = 1
+    return status
+
+def cmd_imports(args):
+    from .profiling import STARTUP_MODULES, import_report
+    rows = import_report(args.modules or STARTUP_MODULES)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return 0
+    print(f"{'module':<26}{'seconds':>10}{'RSS MB':>10}")
+    for row in rows:
+        if row["error"]:
+            print(f"{row['module']:<26}{'-':>10}{'-':>10}  {row['error']}")
+        else:
+            print(f"{row['module']:<26}{row['seconds']:>10.3f}{row['rss_bytes'] / 2**20:>10.1f}")
+    return 0
+
+def cmd_render(args):
+    from . import batch, presets
+    try:
+        params, params_ml = presets.load_preset(args.preset) if args.preset else presets.from_dict({})
+    except (OSError, presets.PresetError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    inputs = batch.expand_inputs(args.inputs)
+    if not inputs:
+        print("error: no input images found", file=sys.stderr)
+        return 2
+    summary = batch.render_batch(inputs, args.out, params, params_ml, workers=args.workers,
+                                 image_format=args.format, quality=args.quality)
+    print(f"rendered {summary['ok']}/{summary['images']} images in {summary['seconds']:.1f}s "
+          f"with {summary['workers']} workers ({summary['images_per_second']:.2f} images/s)")
+    return 1 if summary["failed"] else 0
+
+def cmd_animate(args):
+    from . import animate, presets
+    try:
+        start, _ = presets.load_preset(args.start)
+        end, _ = presets.load_preset(args.end)
+    except (OSError, presets.PresetError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    out = args.out or f"animation.{args.format}"
+    try:
+        summary = animate.render_video(args.image, start, end, out, frames=args.frames, fps=args.fps,
+                                       width=args.width, video_format=args.format, workers=args.workers)
+    except animate.AnimationError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    width, height = summary["size"]
+    print(f"wrote {summary['path']}: {summary['frames']} frames at {width}x{height} in {summary['seconds']:.1f}s "
+          f"({summary['frames_per_second']:.1f} frames/s)")
+    return 0
+
+def cmd_bench(args):
+    from . import bench
+    result = bench.run_suite(sizes=args.sizes, stages=args.stages or None, repeats=args.repeats,
+                             include_ml=not args.no_ml, log=sys.stderr)
+    if args.output:
+        bench.save(result, args.output)
+    print(f"{'case':<28}{'size':>6}{'median s':>11}{'MPix/s':>9}{'traced MB':>11}")
+    for row in result["results"]:
+        if "skipped" in row:
+            print(f"{row['name']:<28}{row['size']:>6}  skipped: {row['skipped']}")
+            continue
+        print(f"{row['name']:<28}{row['size']:>6}{row['wall_s']:>11.4f}{row['mpix_per_s']:>9.1f}"
+              f"{row['peak_traced_bytes'] / 2**20:>11.1f}")
+    if not args.baseline:
+        return 0
+
+    rows = bench.compare(result, bench.load(args.baseline), args.threshold)
+    print(f"\ncompared with {args.baseline} (threshold {args.threshold:.2f}x):")
+    for name, size, old, new, ratio, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:<28}{size:>6}{old:>11.4f}{new:>11.4f}{ratio:>8.2f}x{flag}")
+    return 1 if any(r[-1] for r in rows) else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m sophisticated_palette")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    prefetch = commands.add_parser("prefetch", help="download models into the local model store")
+    prefetch.add_argument("models", nargs="*", metavar="MODEL",
+                          help=f"models to fetch (default: all of {', '.join(models.REGISTRY)})")
+    prefetch.add_argument("--force", action="store_true", help="re-download models that are already present")
+    prefetch.add_argument("--warm-up", action="store_true", help="load the models and run one dummy inference")
+    prefetch.set_defaults(func=cmd_prefetch)
+
+    verify = commands.add_parser("verify", help="check stored models against the manifest")
+    verify.add_argument("models", nargs="*", metavar="MODEL")
+    verify.set_defaults(func=cmd_verify)
+
+    render = commands.add_parser("render", help="render images headlessly against a preset")
+    render.add_argument("inputs", nargs="+", metavar="INPUT", help="image files, directories or glob patterns")
+    render.add_argument("--preset", help='JSON file with "params" and/or "params_ml" (default: sidebar defaults)')
+    render.add_argument("--out", "-o", required=True, help="output directory")
+    render.add_argument("--workers", "-j", type=int, default=None, help="worker processes (default: CPU count)")
+    render.add_argument("--format", choices=["png", "jpeg", "webp"], default="png")
+    render.add_argument("--quality", type=int, default=90, help="JPEG/WebP quality")
+    render.set_defaults(func=cmd_render)
+
+    animate_cmd = commands.add_parser("animate", help="render a video that moves from one preset to another")
+    animate_cmd.add_argument("image", help="source image")
+    animate_cmd.add_argument("start", help="preset JSON for the first frame")
+    animate_cmd.add_argument("end", help="preset JSON for the last frame")
+    animate_cmd.add_argument("--out", "-o", help="output file (default: animation.<format>)")
+    animate_cmd.add_argument("--format", choices=["mp4", "webm"], default="mp4")
+    animate_cmd.add_argument("--frames", "-n", type=int, default=48)
+    animate_cmd.add_argument("--fps", type=int, default=24)
+    animate_cmd.add_argument("--width", type=int, help="output width in pixels (default: source width)")
+    animate_cmd.add_argument("--workers", "-j", type=int, default=None, help="worker processes (default: CPU count)")
+    animate_cmd.set_defaults(func=cmd_animate)
+
+    bench_cmd = commands.add_parser("bench", help="benchmark each pipeline stage on synthetic images")
+    bench_cmd.add_argument("--sizes", nargs="+", default=["512", "1K", "2K"], choices=["512", "1K", "2K", "4K", "8K"])
+    bench_cmd.add_argument("--stages", nargs="+", metavar="CASE", help="only run these cases (e.g. blur vignette defaults)")
+    bench_cmd.add_argument("--repeats", type=int, default=3)
+    bench_cmd.add_argument("--no-ml", action="store_true", help="skip the ML stages")
+    bench_cmd.add_argument("--output", "-o", help="write the results as JSON")
+    bench_cmd.add_argument("--baseline", help="JSON results to compare against; exits 1 on a regression")
+    bench_cmd.add_argument("--threshold", type=float, default=1.25,
+                           help="slowdown ratio that counts as a regression (default: 1.25)")
+    bench_cmd.set_defaults(func=cmd_bench)
+
+    imports = commands.add_parser("imports", help="report the import cost of each startup module")
+    imports.add_argument("modules", nargs="*", metavar="MODULE")
+    imports.add_argument("--json", action="store_true", help="print the report as JSON")
+    imports.set_defaults(func=cmd_imports)
+
+    args = parser.parse_args(argv)
+    unknown = set(getattr(args, "models", None) or ()) - set(models.REGISTRY)
+    if unknown:
+        parser.error(f"unknown model(s): {', '.join(sorted(unknown))}")
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
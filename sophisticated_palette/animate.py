@@ -0,0 +1,138 @@
+# animate.py - Parameter-animation video export through ffmpeg
+"""Render a clip that moves from one preset's ``params`` to another's.
+
+Frame ``i`` of ``n`` renders ``interpolate(start, end, i / (n - 1))`` with
+``process_image`` on a process pool. Frames are written in order, as raw
+RGB, to the stdin of an ``ffmpeg`` subprocess. At most ``max_in_flight``
+frames are queued or held at once, so memory does not depend on the clip
+length. Only the classic pipeline is animated; ``params_ml`` is ignored.
+"""
+import os
+import shutil
+import subprocess
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageOps
+
+from .engine import FILL_COLOR
+
+# format -> ffmpeg output options
+CODECS = {
+    "mp4": ["-c:v", "libx264", "-preset", "medium", "-crf", "18", "-pix_fmt", "yuv420p", "-movflags", "+faststart"],
+    "webm": ["-c:v", "libvpx-vp9", "-crf", "32", "-b:v", "0", "-row-mt", "1", "-pix_fmt", "yuv420p"],
+}
+
+_worker = {}
+
+
+class AnimationError(RuntimeError):
+    """ffmpeg is missing or failed while encoding."""
+
+
+def parse_hex(value):
+    return tuple(int(value.lstrip("#")[i:i + 2], 16) for i in (0, 2, 4))
+
+def interpolate(start, end, t):
+    """``params`` a fraction ``t`` of the way from ``start`` to ``end``.
+
+    Numbers are interpolated linearly (integers are rounded), hex colours
+    per channel; switches and choices flip half-way.
+    """
+    out = {}
+    for key, a in start.items():
+        b = end[key]
+        if isinstance(a, bool) or isinstance(b, bool) or isinstance(a, str) and not a.startswith("#"):
+            out[key] = a if t < 0.5 else b
+        elif isinstance(a, str):
+            mixed = (round(x + (y - x) * t) for x, y in zip(parse_hex(a), parse_hex(b)))
+            out[key] = "#" + "".join(f"{c:02x}" for c in mixed)
+        elif isinstance(a, int) and isinstance(b, int):
+            out[key] = round(a + (b - a) * t)
+        else:
+            out[key] = a + (b - a) * t
+    return out
+
+def frame_size(img, width=None):
+    """Output ``(width, height)`` keeping the aspect ratio, rounded down to even for yuv420p."""
+    if width is None or width >= img.width:
+        width = img.width
+    height = max(2, round(img.height * width / img.width))
+    return max(2, width - width % 2), height - height % 2
+
+def init_worker(path, start, end, frames, size, threads):
+    from . import tiling
+    tiling.FILTER_THREADS = threads
+    from .preview import make_proxy
+    with Image.open(path) as img:
+        # Render at the clip width rather than the source width
+        source, scale = make_proxy(img.convert("RGB"), size[0])
+    _worker.update(image=source, scale=scale, start=start, end=end, frames=frames, size=size)
+
+def render_frame(index):
+    """Raw RGB bytes of frame ``index``, letterboxed to the clip size."""
+    from .engine import process_image
+    from .preview import scale_params
+    t = index / (_worker["frames"] - 1) if _worker["frames"] > 1 else 0.0
+    params = scale_params(interpolate(_worker["start"], _worker["end"], t), _worker["scale"])
+    frame = process_image(_worker["image"], params)
+    if frame.size != _worker["size"]:
+        frame = ImageOps.pad(frame, _worker["size"], Image.LANCZOS, color=FILL_COLOR)
+    return frame.tobytes()
+
+def ffmpeg_command(size, fps, video_format, out_path):
+    return ["ffmpeg", "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{size[0]}x{size[1]}", "-r", str(fps), "-i", "-",
+            *CODECS[video_format], out_path]
+
+def render_video(path, start, end, out_path, frames=48, fps=24, width=None, video_format="mp4",
+                 workers=None, max_in_flight=None, log=sys.stderr):
+    """Encode the animation from ``start`` to ``end`` params; returns a summary dict."""
+    if shutil.which("ffmpeg") is None:
+        raise AnimationError("ffmpeg was not found on PATH")
+    with Image.open(path) as img:
+        size = frame_size(img, width)
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or 2 * workers
+    threads = max(1, (os.cpu_count() or 1) // workers)
+
+    encoder = subprocess.Popen(ffmpeg_command(size, fps, video_format, out_path),
+                               stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+    start_time = time.perf_counter()
+    written = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(path, start, end, frames, size, threads)) as pool:
+            pending = deque()
+            for index in range(frames):
+                pending.append(pool.submit(render_frame, index))
+                if len(pending) >= max_in_flight:
+                    encoder.stdin.write(pending.popleft().result())
+                    written += 1
+                    report(written, frames, start_time, log)
+            while pending:
+                encoder.stdin.write(pending.popleft().result())
+                written += 1
+                report(written, frames, start_time, log)
+        encoder.stdin.close()
+    except BrokenPipeError:
+        pass
+    except BaseException:
+        encoder.kill()
+        encoder.wait()
+        raise
+    errors = encoder.stderr.read().decode(errors="replace").strip()
+    if encoder.wait() != 0:
+        raise AnimationError(f"ffmpeg exited with status {encoder.returncode}: {errors[-500:]}")
+    elapsed = time.perf_counter() - start_time
+    return {"frames": written, "seconds": elapsed, "frames_per_second": written / elapsed if elapsed else 0.0,
+            "size": size, "path": out_path}
+
+def report(done, total, start_time, log):
+    if log is None:
+        return
+    elapsed = time.perf_counter() - start_time
+    rate = done / elapsed if elapsed else 0.0
+    print(f"\rframe {done}/{total} ({rate:.1f} fps)", end="\n" if done == total else "", file=log, flush=True)
@@ -0,0 +1,16 @@
+# backend.py - Lazy entry point to the ML backend
+"""Keep TensorFlow, TF Hub, OpenCV and DeepFace out of classic-only sessions.
+
+The ML Atelier lives in ``sophisticated_palette.ml``, which pulls in the
+heavy ML stack. The app only imports it through ``load()``, once a
+``params_ml`` option or the emotion analysis is actually used.
+"""
+import importlib
+
+def ml_requested(params_ml):
+    """True if any ML Atelier option is switched on."""
+    return not all(v == False or v == 'None' or v == 0.0 for v in params_ml.values())
+
+def load():
+    """Import (once) and return the ML backend module."""
+    return importlib.import_module(".ml", __package__)
@@ -0,0 +1,97 @@
+# batch.py - Headless batch rendering over a process pool
+"""Render many images against one preset without Streamlit.
+
+Work is spread over a process pool. Each worker loads the preset, and the
+ML models it needs, once in its initializer, then renders and writes its
+images straight to the output directory. The parent only collects
+per-image results, so memory does not grow with the batch.
+"""
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from PIL import Image
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".tif", ".tiff", ".bmp")
+FORMATS = {"png": ("PNG", ".png"), "jpeg": ("JPEG", ".jpg"), "webp": ("WEBP", ".webp")}
+
+_worker = {}
+
+
+def expand_inputs(patterns):
+    """Files named by ``patterns``: image files, directories (recursively) or globs."""
+    found = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, _, names in os.walk(pattern):
+                found.extend(os.path.join(root, n) for n in sorted(names) if n.lower().endswith(IMAGE_EXTENSIONS))
+        elif os.path.isfile(pattern):
+            found.append(pattern)
+        else:
+            found.extend(p for p in sorted(glob.glob(pattern, recursive=True))
+                         if os.path.isfile(p) and p.lower().endswith(IMAGE_EXTENSIONS))
+    return list(dict.fromkeys(found))
+
+def output_paths(inputs, out_dir, extension):
+    """One output path per input, named after its stem; clashing stems get a numeric suffix."""
+    seen, paths = {}, []
+    for path in inputs:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        n = seen.get(stem, 0)
+        seen[stem] = n + 1
+        paths.append(os.path.join(out_dir, f"{stem}{'-' + str(n) if n else ''}{extension}"))
+    return paths
+
+def init_worker(params, params_ml, threads):
+    from . import backend, engine, tiling
+    # Images in a batch are distinct, so intermediate stages are never reused
+    engine.PIPELINE.cache.max_bytes = 0
+    tiling.FILTER_THREADS = threads
+    _worker["params"], _worker["params_ml"] = params, params_ml
+    _worker["ml"] = backend.load() if backend.ml_requested(params_ml) else None
+    if _worker["ml"] is not None:
+        _worker["ml"].preload(params_ml)
+
+def render_one(src, dst, image_format, quality):
+    """Render ``src`` into ``dst``; returns ``(src, dst, seconds, error)``."""
+    from .engine import process_image
+    start = time.perf_counter()
+    try:
+        with Image.open(src) as img:
+            out = process_image(img, _worker["params"])
+        if _worker["ml"] is not None:
+            out = _worker["ml"].process_image_ml(out, _worker["params_ml"])
+        tmp = dst + ".part"
+        out.save(tmp, format=image_format, quality=quality)
+        os.replace(tmp, dst)
+        return src, dst, time.perf_counter() - start, None
+    except Exception as e:
+        return src, dst, time.perf_counter() - start, f"{type(e).__name__}: {e}"
+
+def render_batch(inputs, out_dir, params, params_ml, workers=None, image_format="png",
+                 quality=90, log=sys.stderr):
+    """Render ``inputs`` into ``out_dir``; returns a summary dict."""
+    workers = workers or os.cpu_count() or 1
+    pil_format, extension = FORMATS[image_format]
+    os.makedirs(out_dir, exist_ok=True)
+    outputs = output_paths(inputs, out_dir, extension)
+    threads = max(1, (os.cpu_count() or 1) // workers)
+
+    ok, failed = 0, []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(params, params_ml, threads)) as pool:
+        futures = [pool.submit(render_one, src, dst, pil_format, quality) for src, dst in zip(inputs, outputs)]
+        for i, future in enumerate(as_completed(futures), 1):
+            src, dst, seconds, error = future.result()
+            if error:
+                failed.append((src, error))
+                print(f"[{i}/{len(inputs)}] FAILED {src}: {error}", file=log)
+            else:
+                ok += 1
+                print(f"[{i}/{len(inputs)}] {src} -> {dst} ({seconds:.2f}s)", file=log)
+    elapsed = time.perf_counter() - start
+    return {"images": len(inputs), "ok": ok, "failed": failed, "seconds": elapsed,
+            "images_per_second": ok / elapsed if elapsed else 0.0, "workers": workers}
@@ -0,0 +1,199 @@
+# bench.py - Per-stage benchmark suite for the render pipeline
+"""Benchmark every stage of ``process_image`` and the CPU-feasible ML stages.
+
+Inputs are synthetic, seeded images from 512px up to 8K. Each case is run
+once to warm caches and then ``repeats`` times, with the stage cache
+cleared before each run. The results record:
+
+- wall time (median and minimum)
+- throughput in megapixels per second
+- peak traced (NumPy/Python) allocation, from ``tracemalloc`` on one
+  extra run
+- peak RSS
+
+Isolated cases call a single stage function on a prepared buffer.
+Combined cases run the whole ``process_image`` pipeline. ``compare``
+checks a result set against a stored baseline and flags every case whose
+median slowed down past a threshold.
+"""
+import json
+import os
+import platform
+import statistics
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+from . import engine, presets
+from .profiling import measure
+
+SIZES = {
+    "512": (512, 512),
+    "1K": (1024, 1024),
+    "2K": (2048, 2048),
+    "4K": (3840, 2160),
+    "8K": (7680, 4320),
+}
+
+# Every stage switched to its identity setting
+NEUTRAL_PARAMS = {
+    **presets.DEFAULT_PARAMS,
+    'blur': 0.0, 'vignette': 0.0, 'sepia_tone': 0.0, 'brightness': 1.0, 'contrast': 1.0,
+    'patina': False, 'texture': False, 'warmth': 1.0, 'saturation': 1.0, 'highlights': 1.0,
+    'shadows': 0.0, 'sharpness': 1.0, 'edge_enhance': 0.0, 'noise_grain': 0, 'crackle': 0.0,
+    'fade': 0.0, 'rotation': 0, 'zoom': 1.0, 'color_mode': "Natural", 'tint_strength': 0.0,
+}
+
+# (case, stage name, overrides on NEUTRAL_PARAMS)
+STAGE_CASES = (
+    ("rotation", "geometry", {'rotation': 7}),
+    ("zoom", "geometry", {'zoom': 1.5}),
+    ("rotation_zoom", "geometry", {'rotation': 7, 'zoom': 1.5}),
+    ("rotation_zoom_bilinear", "geometry", {'rotation': 7, 'zoom': 1.5, 'resample': "bilinear"}),
+    ("tone", "tone", {'color_mode': "Cool Tone", 'saturation': 0.9, 'warmth': 1.1}),
+    ("blur", "blur", {'blur': 2.0}),
+    ("sharpness", "sharpness", {'sharpness': 1.5}),
+    ("edges", "edges", {'edge_enhance': 0.5}),
+    ("light", "light", {'brightness': 0.95, 'contrast': 1.1}),
+    ("highlights", "highlights", {'highlights': 1.3}),
+    ("tint", "tint", {'shadows': 0.2, 'sepia_tone': 0.25, 'tint_strength': 0.2}),
+    ("grain", "grain", {'noise_grain': 10}),
+    ("vignette", "vignette", {'vignette': 0.3}),
+    ("aging", "aging", {'patina': True, 'fade': 0.1}),
+    ("texture", "texture", {'texture': True}),
+    ("crackle", "crackle", {'crackle': 0.5}),
+)
+
+# Whole-pipeline combinations
+PIPELINE_CASES = (
+    ("defaults", presets.DEFAULT_PARAMS),
+    ("all", {**presets.DEFAULT_PARAMS, 'rotation': 7, 'zoom': 1.2, 'highlights': 1.3, 'color_mode': "Cool Tone",
+             'sharpness': 1.5, 'tint_strength': 0.2, 'crackle': 0.5}),
+)
+
+# ML stages that run on CPU in reasonable time (params_ml overrides)
+ML_CASES = (
+    ("colorization", {'colorization': True}),
+    ("crackle_repair", {'crackle_repair': 0.5}),
+    ("composition_guide", {'composition_guide': True}),
+)
+
+
+def synthetic_image(width, height, seed=0):
+    """Deterministic test card: smooth gradients plus mid-frequency noise."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = np.stack([x / width, y / height, 1 - (x + y) / (width + height)], axis=-1) * 200 + 20
+    noise = rng.normal(0, 18, size=(height // 8 + 1, width // 8 + 1, 3)).astype(np.float32)
+    base += np.repeat(np.repeat(noise, 8, axis=0), 8, axis=1)[:height, :width]
+    return Image.fromarray(np.clip(base, 0, 255).astype(np.uint8), "RGB")
+
+def time_case(fn, pixels, repeats, setup=None):
+    """Warm up, then time ``repeats`` runs of ``fn(setup())`` and one traced run."""
+    def run():
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        fn(arg)
+        return time.perf_counter() - start
+
+    run()
+    times = [run() for _ in range(repeats)]
+    # Prepare the input first so the traced peak covers only ``fn``
+    arg = setup() if setup else None
+    with measure("bench") as m:
+        tracemalloc.start()
+        try:
+            fn(arg)
+            _, traced_peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    median = statistics.median(times)
+    return {
+        "wall_s": median,
+        "min_s": min(times),
+        "repeats": repeats,
+        "pixels": pixels,
+        "mpix_per_s": pixels / median / 1e6 if median else None,
+        "peak_traced_bytes": traced_peak,
+        "rss_peak_bytes": m.rss_peak,
+    }
+
+def run_suite(sizes=("512", "1K", "2K"), stages=None, repeats=3, include_ml=True, log=None):
+    """Run the selected cases at each size; returns the JSON-ready result dict."""
+    stage_by_name = {stage.name: stage for stage in engine.STAGES}
+    results = []
+
+    def record(kind, name, size, fn, pixels, setup=None):
+        if log:
+            print(f"{kind}:{name} @ {size}...", file=log, flush=True)
+        row = {"name": f"{kind}:{name}", "size": size, **time_case(fn, pixels, repeats, setup)}
+        results.append(row)
+
+    for size in sizes:
+        width, height = SIZES[size]
+        img = synthetic_image(width, height)
+        source = engine.to_array(img)
+        pixels = width * height
+
+        for case, stage_name, overrides in STAGE_CASES:
+            if stages and case not in stages:
+                continue
+            params = {**NEUTRAL_PARAMS, **overrides}
+            stage = stage_by_name[stage_name]
+            record("stage", case, size, lambda arr, stage=stage, params=params: stage.run(arr, params),
+                   pixels, setup=source.copy)
+
+        for case, params in PIPELINE_CASES:
+            if stages and case not in stages:
+                continue
+            def render(_, params=params):
+                engine.PIPELINE.cache.clear()
+                engine.process_image(img, params)
+            record("pipeline", case, size, render, pixels)
+
+        if include_ml:
+            try:
+                from . import ml
+            except ImportError as e:
+                results.append({"name": "ml", "size": size, "skipped": f"{type(e).__name__}: {e}"})
+                continue
+            for case, overrides in ML_CASES:
+                if stages and case not in stages:
+                    continue
+                params_ml = {**presets.DEFAULT_PARAMS_ML, **overrides}
+                record("ml", case, size, lambda _, params_ml=params_ml: ml.process_image_ml(img, params_ml), pixels)
+
+    return {"meta": environment(), "results": results}
+
+def environment():
+    import PIL
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pillow": PIL.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+def compare(current, baseline, threshold=1.25):
+    """Rows ``(name, size, baseline_s, current_s, ratio, regressed)`` for cases present in both."""
+    base = {(r["name"], r["size"]): r for r in baseline["results"] if "wall_s" in r}
+    rows = []
+    for r in current["results"]:
+        old = base.get((r["name"], r["size"]))
+        if old is None or "wall_s" not in r:
+            continue
+        ratio = r["wall_s"] / old["wall_s"] if old["wall_s"] else float("inf")
+        rows.append((r["name"], r["size"], old["wall_s"], r["wall_s"], ratio, ratio > threshold))
+    return rows
+
+def save(result, path):
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
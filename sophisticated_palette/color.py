@@ -0,0 +1,106 @@
+# color.py - Fused per-channel colour transforms
+"""Compile runs of constant-colour pipeline steps into one affine transform.
+
+Colour modes, saturation, warmth, brightness, contrast, shadows, sepia,
+custom tint, patina and fade are all per-pixel affine maps of the form
+``rgb' = M @ rgb + b``. ``ColorTransform`` accumulates a run of them into a
+single 3x3 matrix plus offset so the buffer is touched once per run
+instead of once per step.
+
+Pillow clamps to ``[0, 255]`` after every step. A run is therefore closed,
+and clamped, as soon as its map can leave that range, e.g. after
+saturation or gain above 1, or a blend with a negative alpha. Steps that
+stay inside the range are fused with no loss.
+"""
+import numpy as np
+
+# ITU-R 601-2 luma weights, as used by Pillow's "L" conversion.
+LUMA = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+IDENTITY = np.eye(3, dtype=np.float32)
+# Corners of the RGB cube; an affine map stays in range iff they do
+CORNERS = np.array([[r, g, b] for r in (0, 255) for g in (0, 255) for b in (0, 255)], dtype=np.float32)
+# Slack for float32 rounding when checking the range
+RANGE_EPS = 1e-3
+
+
+def clip(arr):
+    """Truncate and clamp in place, mirroring Pillow's 8-bit store after each stage."""
+    np.floor(arr, out=arr)
+    np.clip(arr, 0, 255, out=arr)
+    return arr
+
+
+def in_range(matrix, offset):
+    """Whether ``rgb -> matrix @ rgb + offset`` maps ``[0, 255]`` into itself."""
+    out = CORNERS @ matrix.T + offset
+    return out.min() >= -RANGE_EPS and out.max() <= 255 + RANGE_EPS
+
+
+class ColorTransform:
+    """Accumulated 3x4 affine colour map; every builder method returns ``self``.
+
+    ``passes`` holds the closed runs that must be clamped before the
+    current one (``matrix``, ``offset``) is applied.
+    """
+
+    def __init__(self):
+        self.passes = []
+        self.matrix = IDENTITY.copy()
+        self.offset = np.zeros(3, dtype=np.float32)
+
+    def then(self, matrix, offset):
+        """Follow the current map with ``rgb -> matrix @ rgb + offset``."""
+        matrix = np.asarray(matrix, dtype=np.float32)
+        self.matrix = matrix @ self.matrix
+        self.offset = matrix @ self.offset + np.asarray(offset, dtype=np.float32)
+        if not in_range(self.matrix, self.offset):
+            self.passes.append((self.matrix, self.offset))
+            self.matrix = IDENTITY.copy()
+            self.offset = np.zeros(3, dtype=np.float32)
+        return self
+
+    def blend(self, color, alpha):
+        """``Image.blend`` against a solid colour layer."""
+        color = np.asarray(color, dtype=np.float32)
+        return self.then(IDENTITY * (1.0 - alpha), color * alpha)
+
+    def gain(self, factor):
+        """``ImageEnhance.Brightness``."""
+        return self.then(IDENTITY * factor, 0.0)
+
+    def grayscale(self):
+        """``ImageOps.grayscale`` followed by a conversion back to RGB."""
+        return self.then(np.tile(LUMA, (3, 1)), 0.0)
+
+    def saturation(self, factor):
+        """``ImageEnhance.Color``."""
+        return self.then(IDENTITY * factor + np.tile(LUMA * (1.0 - factor), (3, 1)), 0.0)
+
+    def contrast(self, factor, mean):
+        """``ImageEnhance.Contrast`` around a precomputed mean luma."""
+        return self.then(IDENTITY * factor, np.full(3, (1.0 - factor) * mean))
+
+    def mean_luma(self, channel_means):
+        """Mean luma of the output, given the per-channel means of the input.
+
+        Only exact while nothing needs clamping, i.e. ``passes`` is empty.
+        """
+        return float(LUMA @ (self.matrix @ np.asarray(channel_means, dtype=np.float32) + self.offset))
+
+    def apply(self, arr):
+        """Apply each run in one pass, truncating to 8-bit like Pillow."""
+        for matrix, offset in self.passes + [(self.matrix, self.offset)]:
+            arr = apply_affine(arr, matrix, offset)
+        return arr
+
+
+def apply_affine(arr, matrix, offset):
+    if np.array_equal(matrix, IDENTITY) and not offset.any():
+        return arr
+    if not (matrix - np.diag(np.diag(matrix))).any():
+        arr *= np.diag(matrix)
+        arr += offset
+        return clip(arr)
+    out = arr @ matrix.T
+    out += offset
+    return clip(out)
@@ -0,0 +1,185 @@
+# dream.py - Deep Dream with a cached model and retrace-free steps
+"""Deep Dream over InceptionV3's ``mixed3``/``mixed5`` activations.
+
+The dream model is built once per process on top of the stored InceptionV3
+and every gradient step runs inside a ``tf.function`` with a fixed,
+shape-polymorphic input signature, so new image sizes do not retrace.
+
+Two modes are offered:
+
+``"full"``
+    The original behaviour: gradient ascent on the full-resolution image.
+``"octaves"``
+    Gradient ascent at a ladder of reduced scales, upsampling between
+    octaves, with gradients computed on randomly rolled tiles so memory is
+    bounded by the tile size and tile seams do not show.
+
+Both modes call ``progress(done, total)`` as they go: the full mode every
+``CHUNK_STEPS`` steps, the octave mode after every step. A callback that
+raises (a cancelled background job) stops the dream there.
+"""
+import threading
+from functools import lru_cache
+
+import numpy as np
+import tensorflow as tf
+
+from . import models
+from .profiling import measure
+
+DREAM_LAYERS = ("mixed3", "mixed5")
+MODES = ("full", "octaves")
+# Full-mode steps run per graph call, between progress reports
+CHUNK_STEPS = 5
+
+_lock = threading.Lock()
+
+
+def calc_dream_loss(img, model):
+    img_batch = tf.expand_dims(img, axis=0)
+    layer_activations = model(img_batch)
+    if len(layer_activations) == 1:
+        layer_activations = [layer_activations]
+    losses = []
+    for act in layer_activations:
+        loss = tf.math.reduce_mean(act)
+        losses.append(loss)
+    return tf.reduce_sum(losses)
+
+def random_roll(img, maxroll):
+    """Randomly shift the image to avoid tile boundaries."""
+    shift = tf.random.uniform(shape=[2], minval=-maxroll, maxval=maxroll, dtype=tf.int32)
+    return shift, tf.roll(img, shift=shift, axis=[0, 1])
+
+
+class DeepDream(tf.Module):
+    """Full-resolution gradient ascent; the whole step loop is one traced graph."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    @tf.function(input_signature=(
+        tf.TensorSpec(shape=[None, None, 3], dtype=tf.float32),
+        tf.TensorSpec(shape=[], dtype=tf.int32),
+        tf.TensorSpec(shape=[], dtype=tf.float32),
+    ))
+    def __call__(self, img, steps, step_size):
+        loss = tf.constant(0.0)
+        for _ in tf.range(steps):
+            with tf.GradientTape() as tape:
+                tape.watch(img)
+                loss = calc_dream_loss(img, self.model)
+            gradients = tape.gradient(loss, img)
+            gradients /= tf.math.reduce_std(gradients) + 1e-8
+            img = img + gradients * step_size
+            img = tf.clip_by_value(img, -1, 1)
+        return loss, img
+
+
+class TiledGradients(tf.Module):
+    """Gradients of the dream loss computed tile by tile on a randomly rolled image."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    @tf.function(input_signature=(
+        tf.TensorSpec(shape=[None, None, 3], dtype=tf.float32),
+        tf.TensorSpec(shape=[2], dtype=tf.int32),
+        tf.TensorSpec(shape=[], dtype=tf.int32),
+    ))
+    def __call__(self, img, img_size, tile_size):
+        shift, img_rolled = random_roll(img, tile_size)
+        gradients = tf.zeros_like(img_rolled)
+
+        # Skip the last tile, unless there's only one tile.
+        xs = tf.range(0, img_size[1], tile_size)[:-1]
+        if not tf.cast(len(xs), bool):
+            xs = tf.constant([0])
+        ys = tf.range(0, img_size[0], tile_size)[:-1]
+        if not tf.cast(len(ys), bool):
+            ys = tf.constant([0])
+
+        for x in xs:
+            for y in ys:
+                with tf.GradientTape() as tape:
+                    tape.watch(img_rolled)
+                    img_tile = img_rolled[y:y + tile_size, x:x + tile_size]
+                    loss = calc_dream_loss(img_tile, self.model)
+                gradients = gradients + tape.gradient(loss, img_rolled)
+
+        gradients = tf.roll(gradients, shift=-shift, axis=[0, 1])
+        gradients /= tf.math.reduce_std(gradients) + 1e-8
+        return gradients
+
+
+@lru_cache(maxsize=None)
+def load_dream_model(layers=DREAM_LAYERS):
+    """Feature-extraction model over ``layers``, built once per process."""
+    inception = models.load_inception_model()
+    outputs = [inception.get_layer(name).output for name in layers]
+    return tf.keras.Model(inputs=inception.input, outputs=outputs)
+
+@lru_cache(maxsize=None)
+def load_dreamer():
+    return DeepDream(load_dream_model())
+
+@lru_cache(maxsize=None)
+def load_tiled_gradients():
+    return TiledGradients(load_dream_model())
+
+def deprocess(img):
+    img = (img + 1) / 2.0
+    img = tf.clip_by_value(img, 0, 1)
+    return np.array(img * 255, dtype=np.uint8)
+
+def run_deep_dream(img_np, steps=50, step_size=0.02, progress=None):
+    """Gradient ascent on the full-resolution image, ``CHUNK_STEPS`` steps per graph call."""
+    img = tf.keras.applications.inception_v3.preprocess_input(tf.constant(img_np, dtype=tf.float32))
+    dreamer = load_dreamer()
+    with _lock:
+        for done in range(0, steps, CHUNK_STEPS):
+            chunk = min(CHUNK_STEPS, steps - done)
+            _, img = dreamer(img, tf.constant(chunk), tf.constant(step_size))
+            if progress is not None:
+                progress(done + chunk, steps)
+    return deprocess(img)
+
+def run_deep_dream_octaves(img_np, steps_per_octave=10, step_size=0.01,
+                           octaves=range(-2, 1), octave_scale=1.3, tile_size=512, progress=None):
+    """Gradient ascent at reduced scales, upsampling between octaves, on rolled tiles."""
+    base_shape = tf.shape(img_np)[:-1]
+    img = tf.keras.applications.inception_v3.preprocess_input(tf.constant(img_np, dtype=tf.float32))
+    initial_shape = tf.cast(base_shape, tf.float32)
+    get_tiled_gradients = load_tiled_gradients()
+    total = len(octaves) * steps_per_octave
+    done = 0
+    with _lock:
+        for octave in octaves:
+            new_size = tf.cast(initial_shape * (octave_scale ** octave), tf.int32)
+            img = tf.image.resize(img, new_size)
+            for _ in range(steps_per_octave):
+                gradients = get_tiled_gradients(img, new_size, tf.constant(tile_size))
+                img = img + gradients * step_size
+                img = tf.clip_by_value(img, -1, 1)
+                done += 1
+                if progress is not None:
+                    progress(done, total)
+    img = tf.image.resize(img, base_shape)
+    return deprocess(img)
+
+def dream(img_np, mode="full", progress=None):
+    """Run Deep Dream in ``mode``; returns ``(image, Measurement)``."""
+    with measure(f"Deep Dream ({mode})") as m:
+        if mode == "octaves":
+            out = run_deep_dream_octaves(img_np, progress=progress)
+        else:
+            out = run_deep_dream(img_np, progress=progress)
+    return out, m
+
+def warm_up():
+    """Trace both dream graphs once on a small image."""
+    dummy = np.zeros((64, 64, 3), dtype=np.uint8)
+    run_deep_dream(dummy, steps=1)
+    run_deep_dream_octaves(dummy, steps_per_octave=1, octaves=range(0, 1))
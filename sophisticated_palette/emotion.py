@@ -0,0 +1,96 @@
+# emotion.py - Cached facial emotion analysis
+"""Facial emotion analysis with DeepFace, cached per image and detector.
+
+Faces are detected on a copy downscaled to ``DETECT_SIZE``, so the detector
+never sees a full-size image. Results are cached by image content and
+detector, so analysing the same painting again costs nothing.
+
+DeepFace is imported on first use and its emotion model is built once
+per process.
+"""
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image
+
+from .graph import digest
+
+# Lightest first; "opencv" is a Haar cascade, "retinaface" the most accurate
+DETECTORS = ("opencv", "ssd", "mtcnn", "retinaface")
+DEFAULT_DETECTOR = os.environ.get("SOPHISTICATED_PALETTE_FACE_DETECTOR", "opencv")
+DETECT_SIZE = 1024
+# Input size of the emotion classifier
+FACE_SIZE = 224
+MAX_RESULTS = 256
+
+_lock = threading.Lock()
+_results = OrderedDict()
+
+
+def remember(cache, key, value, limit=MAX_RESULTS):
+    with _lock:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > limit:
+            cache.popitem(last=False)
+
+@lru_cache(maxsize=None)
+def load_emotion_model():
+    """DeepFace's emotion classifier, built once per process."""
+    from deepface import DeepFace
+    try:
+        # deepface >= 0.0.90
+        return DeepFace.build_model(task="facial_attribute", model_name="Emotion")
+    except TypeError:
+        return DeepFace.build_model("Emotion")
+
+def first_face(result):
+    # Older DeepFace returns a dict for a single face, newer a list of faces
+    if isinstance(result, list):
+        return result[0] if result else None
+    return result
+
+def downscale(img_np, size):
+    """``img_np`` shrunk so its long side is at most ``size``; returns ``(array, scale)``."""
+    height, width = img_np.shape[:2]
+    scale = min(1.0, size / max(height, width))
+    if scale == 1.0:
+        return img_np, 1.0
+    small = Image.fromarray(img_np).resize((max(1, round(width * scale)), max(1, round(height * scale))),
+                                           Image.BILINEAR, reducing_gap=2.0)
+    return np.asarray(small), scale
+
+def classify(img_np, detector):
+    from deepface import DeepFace
+    load_emotion_model()
+    return first_face(DeepFace.analyze(img_np, actions=['emotion'], detector_backend=detector,
+                                       enforce_detection=False))
+
+def analyze(img_np_rgb, detector=DEFAULT_DETECTOR):
+    """DeepFace emotion result for the main face in ``img_np_rgb``, or ``None``."""
+    key = digest(img_np_rgb.shape, np.ascontiguousarray(img_np_rgb), detector)
+    with _lock:
+        if key in _results:
+            _results.move_to_end(key)
+            return _results[key]
+
+    small, _ = downscale(img_np_rgb, DETECT_SIZE)
+    result = classify(small, detector)
+    remember(_results, key, result)
+    return result
+
+def describe(result):
+    if not result:
+        return "Could not determine emotion."
+    dominant_emotion = result['dominant_emotion']
+    return f"{dominant_emotion.capitalize()} ({result['emotion'][dominant_emotion]:.1f}%)"
+
+def warm_up(detector=DEFAULT_DETECTOR):
+    """Build the emotion model and ``detector`` and run each once."""
+    from deepface import DeepFace
+    dummy = np.zeros((FACE_SIZE, FACE_SIZE, 3), dtype=np.uint8)
+    classify(dummy, "skip")
+    DeepFace.extract_faces(dummy, detector_backend=detector, enforce_detection=False)
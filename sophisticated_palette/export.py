@@ -0,0 +1,61 @@
+# export.py - On-demand, cached export encoding
+"""Encode finished renders for download.
+
+Encoding only runs when an export is requested. The encoded bytes are kept
+in a ``ByteLRU`` keyed by the render (``rendercache.render_key``) and the
+encoder settings, so asking for the same file again costs nothing.
+Each format has three speed/size settings. PNG never uses ``optimize``,
+which multiplies encode time for a few percent. Baseline JPEG with
+``subsampling=0`` does not use it either: on high-entropy renders,
+``optimize`` overflows Pillow's fixed-size encoder buffer.
+"""
+import os
+from io import BytesIO
+
+from . import profiling
+from .graph import ByteLRU, digest
+
+EXPORT_CACHE_BYTES = int(float(os.environ.get("SOPHISTICATED_PALETTE_EXPORT_CACHE_MB", "64")) * 2**20)
+
+# label -> (Pillow format, extension, mime type)
+FORMATS = {
+    "PNG": ("PNG", ".png", "image/png"),
+    "JPEG": ("JPEG", ".jpg", "image/jpeg"),
+    "WebP": ("WEBP", ".webp", "image/webp"),
+}
+
+COMPRESSION = ("Fastest", "Balanced", "Smallest")
+
+# (format label, compression) -> Pillow save options
+SAVE_OPTIONS = {
+    ("PNG", "Fastest"): {"compress_level": 1},
+    ("PNG", "Balanced"): {"compress_level": 4},
+    ("PNG", "Smallest"): {"compress_level": 9},
+    ("JPEG", "Fastest"): {"quality": 95, "subsampling": 0},
+    ("JPEG", "Balanced"): {"quality": 90, "subsampling": 0},
+    ("JPEG", "Smallest"): {"quality": 82, "optimize": True, "progressive": True},
+    ("WebP", "Fastest"): {"quality": 92, "method": 0},
+    ("WebP", "Balanced"): {"quality": 90, "method": 4},
+    ("WebP", "Smallest"): {"quality": 85, "method": 6},
+}
+
+EXPORT_CACHE = ByteLRU(EXPORT_CACHE_BYTES)
+
+
+def encode(img, label="PNG", compression="Balanced"):
+    """``img`` encoded as ``label`` with the ``compression`` trade-off; returns bytes."""
+    buf = BytesIO()
+    img.save(buf, format=FORMATS[label][0], **SAVE_OPTIONS[label, compression])
+    return buf.getvalue()
+
+def cached_export(key, render, label="PNG", compression="Balanced"):
+    """Encoded bytes for render ``key``, calling ``render()`` and encoding only on a miss."""
+    cache_key = digest(key, label, compression)
+    hit = EXPORT_CACHE.get(cache_key)
+    if hit is not None:
+        return hit.obj
+    img = render()
+    with profiling.stage("export.encode"):
+        data = encode(img, label, compression)
+    EXPORT_CACHE.put(cache_key, memoryview(data))
+    return data
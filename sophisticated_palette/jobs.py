@@ -0,0 +1,141 @@
+# jobs.py - Background ML jobs shared across sessions
+"""Run slow ML renders off the script thread, deduplicated by input.
+
+Jobs are keyed by a hash of their input: the classic render plus
+``params_ml``. A process-wide table maps keys to jobs, so sessions that
+ask for the same render share one job and its result. Each session owns
+at most one job. Submitting a new key releases the session's previous
+job, and a job left with no owners is cancelled. A job that has not
+started never runs. A running job stops at its next progress report;
+super-resolution reports every tile batch and Deep Dream every few steps.
+Style transfer is a single model call, so it runs to completion.
+
+Results are also stored in the render cache, so finished jobs are only
+kept, up to ``MAX_FINISHED`` jobs and ``FINISHED_BYTES`` of results, to
+bridge the rerun that picks them up. A failed job is reported to its own
+session; any other request for its key starts a fresh attempt.
+"""
+import os
+import threading
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+ML_WORKERS = int(os.environ.get("SOPHISTICATED_PALETTE_ML_WORKERS", "1"))
+# How often a page with a pending job checks on it
+POLL_SECONDS = 0.5
+# Finished jobs kept for reuse by later reruns and other sessions
+MAX_FINISHED = 32
+FINISHED_BYTES = int(float(os.environ.get("SOPHISTICATED_PALETTE_JOB_RESULTS_MB", "256")) * 2**20)
+
+_pool = ThreadPoolExecutor(max_workers=ML_WORKERS, thread_name_prefix="palette-ml")
+_lock = threading.Lock()
+_jobs = {}
+_owned = {}
+
+
+class JobCancelled(Exception):
+    """Raised inside a job whose owners have all moved on."""
+
+
+class Job:
+    """One background render; ``fn(progress=..., reports=...)`` runs on the ML pool."""
+
+    def __init__(self, key):
+        self.key = key
+        self.owners = set()
+        self.progress = None
+        self.reports = {}
+        self.cancelled = threading.Event()
+        self.future = None
+        self.finished = False
+        self.nbytes = 0
+
+    def report_progress(self, done, total):
+        if self.cancelled.is_set():
+            raise JobCancelled(self.key)
+        self.progress = (done, total)
+
+    def done(self):
+        return self.future.done()
+
+    def result(self):
+        """The render, or ``None`` if the job was cancelled; re-raises job errors."""
+        try:
+            return self.future.result()
+        except (CancelledError, JobCancelled):
+            return None
+
+    def failed(self):
+        """Whether the job raised something other than a cancellation."""
+        if not self.done() or self.future.cancelled():
+            return False
+        return not isinstance(self.future.exception(), (type(None), JobCancelled))
+
+    def cancel(self):
+        self.cancelled.set()
+        self.future.cancel()
+
+
+def result_bytes(result):
+    """Memory held by a result: a PIL image or anything with ``nbytes``."""
+    if hasattr(result, "getbands"):
+        return result.width * result.height * len(result.getbands())
+    return getattr(result, "nbytes", 0)
+
+def run(job, fn):
+    if job.cancelled.is_set():
+        raise JobCancelled(job.key)
+    result = fn(progress=job.report_progress, reports=job.reports)
+    with _lock:
+        job.nbytes = result_bytes(result)
+        job.finished = True
+        trim()
+    return result
+
+def release(job, owner):
+    job.owners.discard(owner)
+    if not job.owners and not job.done():
+        job.cancel()
+        if _jobs.get(job.key) is job:
+            del _jobs[job.key]
+
+def trim():
+    """Drop the oldest finished jobs over ``MAX_FINISHED`` or ``FINISHED_BYTES``; the newest stays."""
+    finished = [job for job in _jobs.values() if job.finished or job.done()]
+    excess = len(finished) - MAX_FINISHED
+    total = sum(job.nbytes for job in finished)
+    for job in finished[:-1]:
+        if excess <= 0 and total <= FINISHED_BYTES:
+            break
+        del _jobs[job.key]
+        for owner in job.owners:
+            if _owned.get(owner) is job:
+                del _owned[owner]
+        excess -= 1
+        total -= job.nbytes
+
+def submit(key, owner, fn):
+    """The job for ``key``, starting ``fn`` only if no live job has that key.
+
+    ``owner`` identifies the session; its previous job is released.
+    """
+    with _lock:
+        previous = _owned.get(owner)
+        if previous is not None and previous.key != key:
+            release(previous, owner)
+        job = _jobs.get(key)
+        # The session that saw a job fail keeps its error; anyone else retries
+        if job is None or job.cancelled.is_set() or job.failed() and job is not previous:
+            job = Job(key)
+            job.future = _pool.submit(run, job, fn)
+            _jobs[key] = job
+            trim()
+        job.owners.add(owner)
+        _owned[owner] = job
+        return job
+
+def forget(owner):
+    """Release ``owner``'s job, e.g. when the session stops asking for ML."""
+    with _lock:
+        job = _owned.pop(owner, None)
+        if job is not None:
+            release(job, owner)
@@ -0,0 +1,121 @@
+# ml.py - Machine Learning Atelier backend
+"""ML stages applied after the classic pipeline.
+
+Importing this module pulls in OpenCV, so the app reaches it only through
+``backend.load()``. TensorFlow is imported only by the stages that run a
+model: ``dream`` on the first Deep Dream, the others through ``models``
+when a model is loaded. The OpenCV-only stages (re-colorization, crackle
+repair, composition guide) never import it. DeepFace is imported on the
+first emotion analysis (see ``emotion.py``).
+"""
+import cv2
+import numpy as np
+from PIL import Image
+
+from . import emotion, models, profiling, repair, styles, superres
+
+
+def pil_to_cv2(pil_image):
+    """Convert PIL image to OpenCV format (BGR)."""
+    return cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
+
+def cv2_to_pil(cv2_image):
+    """Convert OpenCV image (BGR) to PIL format."""
+    return Image.fromarray(cv2.cvtColor(cv2_image, cv2.COLOR_BGR2RGB))
+
+def tf_tensor_to_image(tensor):
+    """Converts a TensorFlow tensor to a PIL Image."""
+    tensor = tensor * 255
+    tensor = np.array(tensor, dtype=np.uint8)
+    if np.ndim(tensor) > 3:
+        assert tensor.shape[0] == 1
+        tensor = tensor[0]
+    return Image.fromarray(tensor)
+
+def warm_up():
+    """Load every model, run one dummy inference and trace the dream graphs."""
+    from . import dream
+    models.warm_up()
+    dream.warm_up()
+    emotion.warm_up()
+
+def preload(params_ml):
+    """Load only the models ``params_ml`` needs, e.g. once per batch worker."""
+    if params_ml['super_res']:
+        models.load_super_res_model()
+    if params_ml['style_choice'] != 'None':
+        models.load_style_transfer()
+        styles.style_embedding(params_ml['style_choice'])
+    if params_ml['deep_dream']:
+        from . import dream
+        dream.load_dreamer()
+        dream.load_tiled_gradients()
+
+def run_emotion_analysis(img_np_rgb, detector=emotion.DEFAULT_DETECTOR):
+    try:
+        return emotion.describe(emotion.analyze(img_np_rgb, detector))
+    except Exception as e:
+        return f"Analysis failed: {e}"
+
+def compare_styles(img_pil, names):
+    """``img_pil`` restyled with each of ``names``, as PIL images in the same order."""
+    with profiling.stage("ml.style_grid"):
+        return [Image.fromarray(out) for out in styles.stylize_many(np.array(img_pil.convert("RGB")), names)]
+
+def process_image_ml(img_pil, params_ml, progress=None, reports=None):
+    """Apply the ML Atelier options in ``params_ml`` to ``img_pil``.
+
+    ``progress(done, total)`` reports super-resolution tiles and Deep Dream
+    steps; it may raise to stop the run. If ``reports``
+    is a dict, per-stage ``Measurement`` objects are stored in it.
+    """
+    img_np = np.array(img_pil)
+
+    # AI Re-Colorization
+    if params_ml['colorization']:
+        with profiling.stage("ml.colorization"):
+            gray_img = cv2.cvtColor(img_np, cv2.COLOR_RGB2GRAY)
+            # For a real implementation, a colorization model from TF Hub would be used here.
+            # As a placeholder, we'll just show the grayscale to indicate the start of the process.
+            # A real model would be too slow for interactive use without significant setup.
+            # We will blend it with sepia to simulate a "recolorized" feel.
+            colorized_np = cv2.cvtColor(gray_img, cv2.COLOR_GRAY2RGB)
+            sepia_filter = np.array([[0.272, 0.534, 0.131],
+                                     [0.349, 0.686, 0.168],
+                                     [0.393, 0.769, 0.189]])
+            img_np = cv2.transform(colorized_np, sepia_filter.T)
+            img_np = np.clip(img_np, 0, 255).astype(np.uint8)
+
+    # AI Super-Resolution, in overlapping tiles under a memory budget
+    if params_ml['super_res']:
+        with profiling.stage("ml.super_res"):
+            img_np = superres.upscale(img_np, progress=progress)
+
+    # Neural Style Transfer (transfer network only; style embeddings are cached)
+    if params_ml['style_choice'] != 'None':
+        with profiling.stage("ml.style"):
+            img_np = styles.stylize(img_np, params_ml['style_choice'])
+
+    # Deep Dream (cached dream model, retrace-free steps)
+    if params_ml['deep_dream']:
+        # Imports TensorFlow, so only when Deep Dream is used
+        from . import dream
+        mode = params_ml['deep_dream'] if params_ml['deep_dream'] in dream.MODES else "full"
+        with profiling.stage("ml.deep_dream"):
+            img_np, dream_report = dream.dream(img_np, mode, progress=progress)
+        if reports is not None:
+            reports['deep_dream'] = dream_report
+
+    # AI Crackle Repair, only on tiles with cracks; the slider sets the sensitivity
+    if params_ml['crackle_repair'] > 0:
+        with profiling.stage("ml.crackle_repair"):
+            img_np = repair.repair_cracks(img_np, params_ml['crackle_repair'])
+
+    # Composition Guide
+    if params_ml['composition_guide']:
+        h, w, _ = img_np.shape
+        for i in range(1, 3):
+            cv2.line(img_np, (w * i // 3, 0), (w * i // 3, h), (212, 175, 55, 100), 1)
+            cv2.line(img_np, (0, h * i // 3), (w, h * i // 3), (212, 175, 55, 100), 1)
+
+    return Image.fromarray(img_np)
@@ -0,0 +1,265 @@
+# models.py - Local model store for the Machine Learning Atelier
+"""Offline registry of the ML Atelier's models.
+
+Models live under ``MODEL_DIR`` (``SOPHISTICATED_PALETTE_MODEL_DIR``,
+default ``~/.cache/sophisticated_palette/models``), one entry per model,
+with a ``manifest.json`` that records the SHA-256 digest of each entry's
+files. Every load re-checks that digest before handing the model to
+TensorFlow. A missing model is downloaded on first use unless
+``SOPHISTICATED_PALETTE_OFFLINE`` is set. On air-gapped nodes, run
+``python -m sophisticated_palette prefetch`` on a connected machine and
+copy the directory across.
+
+TensorFlow is only imported when a model is actually loaded.
+"""
+import hashlib
+import io
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+from functools import lru_cache
+
+MODEL_DIR = os.path.expanduser(os.environ.get(
+    "SOPHISTICATED_PALETTE_MODEL_DIR", os.path.join("~", ".cache", "sophisticated_palette", "models")))
+OFFLINE = os.environ.get("SOPHISTICATED_PALETTE_OFFLINE", "") not in ("", "0")
+WARM_UP = os.environ.get("SOPHISTICATED_PALETTE_WARM_UP", "") not in ("", "0")
+
+MANIFEST = "manifest.json"
+
+
+class ModelStoreError(RuntimeError):
+    """A model is missing, cannot be fetched, or fails its integrity check."""
+
+
+class ModelSpec:
+    """A registry entry: ``kind`` is ``"saved_model"`` (a TF Hub tarball) or ``"file"``."""
+
+    def __init__(self, name, url, kind, filename=None, sha256=None):
+        self.name = name
+        self.url = url
+        self.kind = kind
+        self.filename = filename
+        self.sha256 = sha256
+
+    @property
+    def path(self):
+        root = os.path.join(MODEL_DIR, self.name)
+        return os.path.join(root, self.filename) if self.kind == "file" else root
+
+
+REGISTRY = {
+    spec.name: spec for spec in (
+        # Magenta arbitrary stylization, split into its style-prediction and
+        # style-transfer networks so style embeddings can be cached
+        ModelSpec("style_predict",
+                  "https://tfhub.dev/google/lite-model/magenta/arbitrary-image-stylization-v1-256/fp16/prediction/1"
+                  "?lite-format=tflite",
+                  "file", filename="style_predict.tflite"),
+        ModelSpec("style_transfer",
+                  "https://tfhub.dev/google/lite-model/magenta/arbitrary-image-stylization-v1-256/fp16/transfer/1"
+                  "?lite-format=tflite",
+                  "file", filename="style_transfer.tflite"),
+        ModelSpec("super_res", "https://tfhub.dev/captain-pool/esrgan-tf2/1", "saved_model"),
+        ModelSpec("inception",
+                  "https://storage.googleapis.com/tensorflow/keras-applications/inception_v3/"
+                  "inception_v3_weights_tf_dim_ordering_tf_kernels_notop.h5",
+                  "file", filename="inception_v3_notop.h5"),
+    )
+}
+
+_lock = threading.Lock()
+
+
+# ==================== MANIFEST & INTEGRITY ====================
+
+def read_manifest():
+    try:
+        with open(os.path.join(MODEL_DIR, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def write_manifest(manifest):
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    tmp = os.path.join(MODEL_DIR, MANIFEST + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, os.path.join(MODEL_DIR, MANIFEST))
+
+def tree_digest(path):
+    """SHA-256 over the relative paths and contents of every file under ``path``."""
+    h = hashlib.sha256()
+    if os.path.isfile(path):
+        files = [(os.path.basename(path), path)]
+    else:
+        files = sorted(
+            (os.path.relpath(os.path.join(root, name), path), os.path.join(root, name))
+            for root, _, names in os.walk(path) for name in names)
+    for rel, full in files:
+        h.update(rel.replace(os.sep, "/").encode())
+        with open(full, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+    return h.hexdigest()
+
+def verify(name):
+    """Raise ``ModelStoreError`` unless the stored model matches its recorded digest."""
+    spec = REGISTRY[name]
+    if not os.path.exists(spec.path):
+        raise ModelStoreError(f"Model '{name}' is not in the local store at {spec.path}.")
+    expected = spec.sha256 or read_manifest().get(name, {}).get("sha256")
+    if expected is None:
+        raise ModelStoreError(f"Model '{name}' has no recorded digest; re-run prefetch.")
+    actual = tree_digest(spec.path)
+    if actual != expected:
+        raise ModelStoreError(f"Model '{name}' failed its integrity check ({actual} != {expected}).")
+    return spec.path
+
+def is_available(name):
+    try:
+        verify(name)
+        return True
+    except ModelStoreError:
+        return False
+
+
+# ==================== FETCHING ====================
+
+def download(url):
+    import requests
+    response = requests.get(url, timeout=60)
+    response.raise_for_status()
+    return response.content
+
+def fetch(name, force=False):
+    """Download ``name`` into the store and record its digest."""
+    spec = REGISTRY[name]
+    with _lock:
+        if not force and is_available(name):
+            return spec.path
+        if OFFLINE:
+            raise ModelStoreError(f"Model '{name}' is missing and SOPHISTICATED_PALETTE_OFFLINE is set.")
+
+        os.makedirs(MODEL_DIR, exist_ok=True)
+        root = os.path.join(MODEL_DIR, name)
+        staging = tempfile.mkdtemp(prefix=f".{name}-", dir=MODEL_DIR)
+        try:
+            if spec.kind == "saved_model":
+                payload = download(spec.url + "?tf-hub-format=compressed")
+                with tarfile.open(fileobj=io.BytesIO(payload), mode="r:gz") as tar:
+                    try:
+                        tar.extractall(staging, filter="data")
+                    except TypeError:
+                        tar.extractall(staging)
+            else:
+                with open(os.path.join(staging, spec.filename), "wb") as f:
+                    f.write(download(spec.url))
+            digest = tree_digest(staging if spec.kind == "saved_model" else os.path.join(staging, spec.filename))
+            if spec.sha256 and digest != spec.sha256:
+                raise ModelStoreError(f"Downloaded model '{name}' does not match its pinned digest.")
+            shutil.rmtree(root, ignore_errors=True)
+            os.replace(staging, root)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+        manifest = read_manifest()
+        manifest[name] = {"url": spec.url, "sha256": digest}
+        write_manifest(manifest)
+        return spec.path
+
+def model_path(name):
+    """Verified local path of ``name``, (re-)fetching it first if allowed."""
+    try:
+        return verify(name)
+    except ModelStoreError:
+        if OFFLINE:
+            raise
+        return fetch(name, force=True)
+
+def prefetch(names=None, force=False):
+    """Fetch every model in ``names`` (default: the whole registry)."""
+    return {name: fetch(name, force=force) for name in (names or REGISTRY)}
+
+
+# ==================== LOADERS ====================
+
+class TFLiteModel:
+    """Thread-safe wrapper around a TFLite interpreter.
+
+    Inputs keep the shapes they were last run with; a call with other
+    shapes resizes them first.
+    """
+
+    def __init__(self, path):
+        import tensorflow as tf
+        self.interpreter = tf.lite.Interpreter(model_path=path)
+        self.interpreter.allocate_tensors()
+        self.inputs = self.interpreter.get_input_details()
+        self.outputs = self.interpreter.get_output_details()
+        # Shapes the model was exported with, kept across resizes
+        self.native_shapes = [tuple(d["shape"]) for d in self.inputs]
+        self._lock = threading.Lock()
+
+    def input_shape(self, i=0):
+        return tuple(self.inputs[i]["shape"])
+
+    def input_index(self, predicate):
+        """Position of the first input whose shape satisfies ``predicate``."""
+        return next(i for i, d in enumerate(self.inputs) if predicate(tuple(d["shape"])))
+
+    def resize_inputs(self, shapes):
+        """Give the inputs ``shapes``, in input-detail order; call with the lock held."""
+        for detail, shape in zip(self.inputs, shapes):
+            self.interpreter.resize_tensor_input(detail["index"], list(shape))
+        self.interpreter.allocate_tensors()
+        self.inputs = self.interpreter.get_input_details()
+        self.outputs = self.interpreter.get_output_details()
+
+    def __call__(self, *arrays):
+        """Run one inference; ``arrays`` are given in input-detail order.
+
+        Arrays whose shapes (batch size or image size) differ from the
+        current inputs resize them first.
+        """
+        with self._lock:
+            if any(array.shape != tuple(detail["shape"]) for detail, array in zip(self.inputs, arrays)):
+                self.resize_inputs([array.shape for array in arrays])
+            for detail, array in zip(self.inputs, arrays):
+                self.interpreter.set_tensor(detail["index"], array.astype(detail["dtype"]))
+            self.interpreter.invoke()
+            return self.interpreter.get_tensor(self.outputs[0]["index"])
+
+@lru_cache(maxsize=None)
+def load_style_predictor():
+    return TFLiteModel(model_path("style_predict"))
+
+@lru_cache(maxsize=None)
+def load_style_transfer():
+    return TFLiteModel(model_path("style_transfer"))
+
+@lru_cache(maxsize=None)
+def load_style_transfer_batch():
+    """A second transfer interpreter for batched calls, so the single-image one keeps its shapes."""
+    return TFLiteModel(model_path("style_transfer"))
+
+@lru_cache(maxsize=None)
+def load_super_res_model():
+    import tensorflow_hub as hub
+    return hub.load(model_path("super_res"))
+
+@lru_cache(maxsize=None)
+def load_inception_model():
+    import tensorflow as tf
+    return tf.keras.applications.InceptionV3(include_top=False, weights=model_path("inception"))
+
+def warm_up():
+    """Load every model and run one dummy inference so graphs are traced before the first request."""
+    import numpy as np
+    import tensorflow as tf
+    for model in (load_style_predictor(), load_style_transfer()):
+        model(*(np.zeros(d["shape"], dtype=np.float32) for d in model.inputs))
+    load_super_res_model()(tf.zeros([1, 64, 64, 3]))
+    load_inception_model()(tf.zeros([1, 299, 299, 3]))
@@ -0,0 +1,74 @@
+# presets.py - Default parameters and JSON presets
+"""Saved ``params`` / ``params_ml`` presets.
+
+A preset is a JSON object ``{"params": {...}, "params_ml": {...}}``; any
+key left out takes the default below. The defaults mirror the initial
+widget values of the sidebar in ``app.py``.
+"""
+import json
+
+DEFAULT_PARAMS = {
+    'blur': 2.0,
+    'vignette': 0.3,
+    'sepia_tone': 0.25,
+    'brightness': 0.95,
+    'contrast': 1.1,
+    'patina': True,
+    'texture': True,
+    'warmth': 1.1,
+    'saturation': 0.9,
+    'hue_shift': 0,
+    'highlights': 1.0,
+    'shadows': 0.2,
+    'sharpness': 1.0,
+    'edge_enhance': 0.5,
+    'noise_grain': 10,
+    'crackle': 0.0,
+    'fade': 0.1,
+    'rotation': 0,
+    'zoom': 1.0,
+    'resample': "lanczos",
+    'color_mode': "Natural",
+    'tint_color': "#704214",
+    'tint_strength': 0.0,
+}
+
+DEFAULT_PARAMS_ML = {
+    'style_choice': 'None',
+    'super_res': False,
+    'crackle_repair': 0.0,
+    'composition_guide': False,
+    'deep_dream': False,
+    'colorization': False,
+}
+
+
+class PresetError(ValueError):
+    """A preset file is malformed or names unknown parameters."""
+
+
+def merge(overrides, defaults, section):
+    unknown = set(overrides) - set(defaults)
+    if unknown:
+        raise PresetError(f"Unknown {section} key(s): {', '.join(sorted(unknown))}")
+    return {**defaults, **overrides}
+
+def from_dict(data):
+    """``(params, params_ml)`` from a preset dict, filled in with defaults."""
+    if not isinstance(data, dict) or set(data) - {"params", "params_ml"}:
+        raise PresetError('A preset must be an object with "params" and/or "params_ml".')
+    return (merge(data.get("params", {}), DEFAULT_PARAMS, "params"),
+            merge(data.get("params_ml", {}), DEFAULT_PARAMS_ML, "params_ml"))
+
+def to_dict(params, params_ml):
+    return {"params": dict(params), "params_ml": dict(params_ml)}
+
+def load_preset(path):
+    with open(path) as f:
+        try:
+            return from_dict(json.load(f))
+        except json.JSONDecodeError as e:
+            raise PresetError(f"{path}: {e}") from None
+
+def dumps(params, params_ml):
+    return json.dumps(to_dict(params, params_ml), indent=2, sort_keys=True)
@@ -0,0 +1,66 @@
+# preview.py - Preview-resolution proxy rendering
+"""Render interactive previews at display width instead of source resolution.
+
+The gallery shows the artwork at roughly the width of the centre column,
+so reruns triggered by sliders work on a downscaled proxy of the source.
+Parameters measured in pixels are rescaled so the proxy looks like a
+shrunken full-resolution render. The vignette band is already a fraction
+of the image size, and the 3x3 sharpen/edge kernels cannot be scaled, so
+those are left alone.
+
+What goes to the browser is a display-sized WebP (or JPEG) encoded here
+rather than by Streamlit. Encoding is deterministic, so an unchanged render
+produces the same bytes, and therefore the same media URL, and the browser
+keeps its copy. Encoded previews are cached by render hash.
+"""
+import os
+from io import BytesIO
+
+from PIL import Image
+
+from .graph import ByteLRU, digest, source_digest
+
+PREVIEW_WIDTH = int(os.environ.get("SOPHISTICATED_PALETTE_PREVIEW_WIDTH", "900"))
+PREVIEW_FORMAT = os.environ.get("SOPHISTICATED_PALETTE_PREVIEW_FORMAT", "WEBP").upper()
+PREVIEW_QUALITY = int(os.environ.get("SOPHISTICATED_PALETTE_PREVIEW_QUALITY", "82"))
+
+PREVIEW_FORMATS = {"WEBP": {"method": 2}, "JPEG": {"optimize": False, "subsampling": 2}}
+
+_encoded = ByteLRU(32 * 2**20)
+
+# params entries expressed in source pixels
+RADIUS_PARAMS = ("blur",)
+
+
+def make_proxy(img, width=PREVIEW_WIDTH):
+    """Downscale ``img`` to ``width`` pixels wide; returns ``(proxy, scale)``."""
+    if img.width <= width:
+        return img, 1.0
+    scale = width / img.width
+    size = (width, max(1, round(img.height * scale)))
+    return img.resize(size, Image.LANCZOS, reducing_gap=2.0), scale
+
+def scale_params(params, scale):
+    """Copy of ``params`` with pixel radii multiplied by ``scale``."""
+    if scale == 1.0:
+        return params
+    scaled = dict(params)
+    for key in RADIUS_PARAMS:
+        scaled[key] = params[key] * scale
+    return scaled
+
+def encode_preview(img, quality=PREVIEW_QUALITY, width=PREVIEW_WIDTH, image_format=PREVIEW_FORMAT):
+    """``img`` downscaled to at most ``width`` and encoded for display; returns bytes.
+
+    Identical renders return the identical cached ``bytes`` object.
+    """
+    key = digest(source_digest(img), quality, width, image_format)
+    hit = _encoded.get(key)
+    if hit is not None:
+        return hit.obj
+    img, _ = make_proxy(img.convert("RGB"), width)
+    buf = BytesIO()
+    img.save(buf, format=image_format, quality=quality, **PREVIEW_FORMATS[image_format])
+    data = buf.getvalue()
+    _encoded.put(key, memoryview(data))
+    return data
@@ -0,0 +1,336 @@
+# profiling.py - Wall-time and memory measurement helpers
+"""Lightweight wall-time, CPU-time and peak-memory measurement.
+
+Peak memory is the process resident set size sampled on a background
+thread while the measured block runs, so it also covers allocations made
+by TensorFlow and other native code that ``tracemalloc`` cannot see.
+
+The render profile is opt-in: ``begin`` installs a ``Profiler`` on the
+calling thread and pipeline code wraps its stages in ``stage(name)``.
+Without one installed ``stage`` returns a shared no-op context manager.
+"""
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+import weakref
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def current_rss():
+    """Resident set size in bytes (Linux ``/proc``; falls back to the lifetime peak)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return peak_rss()
+
+def peak_rss():
+    """Lifetime peak resident set size in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+class Measurement:
+    """Result of ``measure``: seconds, CPU seconds and resident-memory figures in bytes."""
+
+    def __init__(self, label):
+        self.label = label
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.rss_start = 0
+        self.rss_peak = 0
+
+    @property
+    def rss_growth(self):
+        return max(0, self.rss_peak - self.rss_start)
+
+    def as_dict(self):
+        return {"label": self.label, "wall_s": self.wall, "cpu_s": self.cpu,
+                "rss_start_bytes": self.rss_start, "rss_peak_bytes": self.rss_peak,
+                "rss_growth_bytes": self.rss_growth}
+
+    def __str__(self):
+        return (f"{self.label}: {self.wall:.2f}s wall, {self.cpu:.2f}s CPU, "
+                f"peak RSS {self.rss_peak / 2**20:.0f} MB (+{self.rss_growth / 2**20:.0f} MB)")
+
+
+@contextmanager
+def measure(label, interval=0.01):
+    """Time the block and sample its peak RSS every ``interval`` seconds."""
+    m = Measurement(label)
+    m.rss_start = m.rss_peak = current_rss()
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(interval):
+            m.rss_peak = max(m.rss_peak, current_rss())
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield m
+    finally:
+        m.wall = time.perf_counter() - wall
+        m.cpu = time.process_time() - cpu
+        done.set()
+        sampler.join()
+        m.rss_peak = max(m.rss_peak, current_rss())
+
+
+# ==================== RENDER PROFILE ====================
+
+# Profile every render in every session (wall and CPU time only)
+PROFILE_ALL = os.environ.get("SOPHISTICATED_PALETTE_PROFILE", "") not in ("", "0")
+# Serve Prometheus metrics on this port; implies PROFILE_ALL
+METRICS_PORT = int(os.environ.get("SOPHISTICATED_PALETTE_METRICS_PORT", "0") or 0)
+
+LOG = logging.getLogger("sophisticated_palette.profile")
+
+_local = threading.local()
+# Profilers currently tracing memory, across all threads; tracemalloc runs
+# while there is at least one. ``_trace_epoch`` counts traced begins, so a
+# stage can tell that another traced run overlapped it.
+_trace_lock = threading.RLock()
+_tracers = 0
+_trace_epoch = 0
+_started_tracing = False
+
+
+class StageMetrics:
+    """Process-wide per-stage totals, shared by every session."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {}
+
+    def observe(self, record):
+        with self._lock:
+            runs, wall, cpu, alloc = self._totals.get(record["stage"], (0, 0.0, 0.0, 0))
+            self._totals[record["stage"]] = (runs + 1, wall + record["wall_s"], cpu + record["cpu_s"],
+                                             alloc + (record["alloc_bytes"] or 0))
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._totals)
+
+    def prometheus_text(self):
+        """The totals in the Prometheus text exposition format."""
+        series = (
+            ("runs_total", "Completed runs per stage.", 0),
+            ("seconds_total", "Wall-clock seconds spent per stage.", 1),
+            ("cpu_seconds_total", "Process CPU seconds spent per stage.", 2),
+            ("allocated_bytes_total", "Peak traced allocation per stage, summed over traced runs.", 3),
+        )
+        totals = self.snapshot()
+        lines = []
+        for suffix, help_text, field in series:
+            name = f"sophisticated_palette_stage_{suffix}"
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            lines += [f'{name}{{stage="{stage}"}} {values[field]}' for stage, values in sorted(totals.items())]
+        return "\n".join(lines) + "\n"
+
+
+METRICS = StageMetrics()
+
+
+def _alone():
+    """The trace epoch if this is the only traced profiler running, else ``None``."""
+    with _trace_lock:
+        return _trace_epoch if _tracers == 1 else None
+
+
+class _StageTimer:
+    __slots__ = ("profiler", "name", "wall", "cpu", "traced", "epoch")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        # The traced peak is process-wide, so allocation is only reported
+        # for stages that no other traced run overlapped
+        self.epoch = _alone() if self.profiler.trace_memory else None
+        self.traced = self.epoch is not None and tracemalloc.is_tracing()
+        if self.traced:
+            tracemalloc.reset_peak()
+            self.traced = tracemalloc.get_traced_memory()[0]
+        self.wall, self.cpu = time.perf_counter(), time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        wall, cpu = time.perf_counter() - self.wall, time.process_time() - self.cpu
+        alloc = None
+        if self.traced is not False and tracemalloc.is_tracing():
+            peak = tracemalloc.get_traced_memory()[1]
+            if _alone() == self.epoch:
+                alloc = max(0, peak - self.traced)
+        self.profiler.add(self.name, wall, cpu, alloc)
+        return False
+
+
+class Profiler:
+    """Per-render stage records: wall time, process CPU time and allocated bytes.
+
+    Allocation is the peak ``tracemalloc`` growth while the stage ran, so it
+    covers NumPy and Python buffers but not native TensorFlow/OpenCV memory.
+    The peak is process-wide, so it is left out (``None``) for stages that
+    overlapped another session's traced run. A disabled profiler hands out
+    a shared no-op context manager.
+    """
+
+    def __init__(self, enabled=True, trace_memory=False):
+        self.enabled = enabled
+        self.trace_memory = trace_memory
+        self.records = []
+        # Shared with the finalizer that releases this profiler's tracing slot
+        self.tracing = None
+
+    def stage(self, name):
+        return _StageTimer(self, name) if self.enabled else _NO_OP
+
+    def add(self, name, wall, cpu, alloc=None):
+        record = {"stage": name, "wall_s": wall, "cpu_s": cpu, "alloc_bytes": alloc}
+        self.records.append(record)
+        METRICS.observe(record)
+        if LOG.isEnabledFor(logging.INFO):
+            LOG.info(json.dumps(record))
+
+    @property
+    def total_wall(self):
+        return sum(r["wall_s"] for r in self.records)
+
+
+_NO_OP = nullcontext()
+_DISABLED = Profiler(enabled=False)
+
+
+def current():
+    """The profiler installed on this thread by ``begin``, or a disabled one."""
+    return getattr(_local, "profiler", _DISABLED)
+
+def stage(name):
+    """Time the block as stage ``name`` on this thread's profiler."""
+    return current().stage(name)
+
+def begin(enabled=True, trace_memory=False):
+    """Install a fresh profiler on this thread, replacing any left by an earlier run.
+
+    Callers must pair it with ``end`` in a ``finally`` block.
+    """
+    global _tracers, _trace_epoch, _started_tracing
+    end()
+    profiler = Profiler(enabled or PROFILE_ALL or bool(METRICS_PORT), trace_memory and enabled)
+    if profiler.trace_memory:
+        with _trace_lock:
+            _tracers += 1
+            _trace_epoch += 1
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _started_tracing = True
+        # A thread that dies without ``end`` still releases its slot once
+        # its thread-local profiler is collected
+        profiler.tracing = [True]
+        weakref.finalize(profiler, _untrace, profiler.tracing)
+    _local.profiler = profiler
+    return profiler
+
+def _untrace(tracing):
+    global _tracers, _started_tracing
+    with _trace_lock:
+        if not tracing[0]:
+            return
+        tracing[0] = False
+        _tracers -= 1
+        if not _tracers and _started_tracing:
+            _started_tracing = False
+            tracemalloc.stop()
+
+def end():
+    """Remove this thread's profiler; the last traced one stops ``tracemalloc`` if ``begin`` started it."""
+    profiler = getattr(_local, "profiler", _DISABLED)
+    _local.profiler = _DISABLED
+    if profiler.tracing:
+        _untrace(profiler.tracing)
+    return profiler
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+        body = METRICS.prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def serve_metrics(port=METRICS_PORT):
+    """Serve ``/metrics`` on ``port`` from a daemon thread, once per process."""
+    global _server
+    with _server_lock:
+        if _server is None and port:
+            _server = ThreadingHTTPServer(("", port), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+    return _server
+
+
+# ==================== IMPORT COST ====================
+
+# Modules the app may import, cheapest first; the last four are the ML stack
+STARTUP_MODULES = ("numpy", "PIL.Image", "streamlit", "sophisticated_palette",
+                   "cv2", "tensorflow", "tensorflow_hub", "deepface.DeepFace")
+
+# Runs in a bare interpreter; it must not import anything it is measuring
+_IMPORT_PROBE = """
+import json, os, resource, sys, time
+sys.path.insert(0, sys.argv[2])
+def current_rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+rss = current_rss()
+start = time.perf_counter()
+try:
+    __import__(sys.argv[1])
+    error = None
+except Exception as e:
+    error = f"{type(e).__name__}: {e}"
+print(json.dumps({"seconds": time.perf_counter() - start, "rss_bytes": current_rss() - rss, "error": error}))
+"""
+
+
+def import_cost(module):
+    """Wall time and RSS growth of importing ``module`` in a fresh interpreter."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    proc = subprocess.run([sys.executable, "-c", _IMPORT_PROBE, module, root],
+                          capture_output=True, text=True)
+    lines = proc.stdout.strip().splitlines()
+    if not lines:
+        return {"module": module, "seconds": None, "rss_bytes": None, "error": proc.stderr.strip()[-200:]}
+    return {"module": module, **json.loads(lines[-1])}
+
+def import_report(modules=STARTUP_MODULES):
+    """``import_cost`` for each module, each measured in isolation."""
+    return [import_cost(module) for module in modules]
@@ -0,0 +1,200 @@
+# rendercache.py - Finished renders shared across sessions and restarts
+"""Two-tier cache of finished renders.
+
+Keys combine the source-image hash with the canonical JSON of ``params``
+and/or ``params_ml``, salted with ``PIPELINE_VERSION``: a hash of this
+package's sources and the Pillow and NumPy versions. A deploy that changes
+how images are rendered therefore never serves renders left on disk by
+the old code. ML renders are keyed with ``ml_render_key``, which also
+mixes in ``model_version()``: the stored models' manifest digests and the
+TensorFlow version. Re-fetching or replacing a model therefore retires
+the ML renders made with the old one. The memory tier is a ``ByteLRU`` of read-only uint8
+arrays. The disk tier keeps one ``.npy`` file per render under
+``RENDER_CACHE_DIR``, indexed by another ``ByteLRU`` that deletes a file
+when its entry is evicted. Disk hits are memory-mapped
+(``np.load(mmap_mode="r")``) and promoted to the memory tier. Each tier
+has its own byte budget and hit/miss/eviction counters.
+
+Several server processes may share the directory. Each keeps its own index,
+seeded from the files present at start-up, oldest first, and adopts files
+written by the others when it first misses on them.
+"""
+import glob
+import importlib.metadata
+import json
+import os
+import tempfile
+import threading
+
+import numpy as np
+import PIL
+from PIL import Image
+
+from . import models
+from .graph import ByteLRU, digest
+
+RENDER_CACHE_DIR = os.environ.get("SOPHISTICATED_PALETTE_RENDER_CACHE_DIR",
+                                  os.path.join(os.path.expanduser("~"), ".cache", "sophisticated_palette", "renders"))
+MEMORY_BYTES = int(float(os.environ.get("SOPHISTICATED_PALETTE_RENDER_CACHE_MB", "128")) * 2**20)
+# 0 switches the disk tier off
+DISK_BYTES = int(float(os.environ.get("SOPHISTICATED_PALETTE_RENDER_DISK_MB", "2048")) * 2**20)
+
+
+def pipeline_version():
+    """Hash of everything that decides a render's pixels, besides its inputs."""
+    sources = sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "*.py")))
+    contents = []
+    for path in sources:
+        with open(path, "rb") as f:
+            contents.append(f.read())
+    return digest(PIL.__version__, np.__version__, *contents)
+
+PIPELINE_VERSION = pipeline_version()
+
+_model_version = (None, None)
+_model_lock = threading.Lock()
+
+
+def tensorflow_version():
+    """Installed TensorFlow version, read without importing it."""
+    try:
+        return importlib.metadata.version("tensorflow")
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+def model_version():
+    """Hash of the model manifest's digests and the TensorFlow version.
+
+    Recomputed only when the manifest file changes, e.g. after
+    ``prefetch --force`` or a first download.
+    """
+    global _model_version
+    try:
+        stat = os.stat(os.path.join(models.MODEL_DIR, models.MANIFEST))
+        stamp = (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        stamp = ()
+    with _model_lock:
+        if _model_version[0] == stamp:
+            return _model_version[1]
+    manifest = models.read_manifest()
+    version = digest(tensorflow_version(), sorted((name, entry.get("sha256")) for name, entry in manifest.items()))
+    with _model_lock:
+        _model_version = (stamp, version)
+    return version
+
+
+def canonical(params):
+    """Stable JSON text for a params dict."""
+    return json.dumps(params, sort_keys=True, separators=(",", ":"))
+
+def render_key(source_key, *param_dicts):
+    """Key of the render of ``source_key`` under ``param_dicts``, applied in order."""
+    return digest(PIPELINE_VERSION, source_key, *(canonical(p) for p in param_dicts))
+
+def ml_render_key(upstream_key, params_ml):
+    """Key of the ML render of ``upstream_key`` under ``params_ml``, tied to the stored models."""
+    return digest(render_key(upstream_key, params_ml), model_version())
+
+
+class DiskEntry:
+    """Index entry of the disk tier: the file and its size."""
+
+    def __init__(self, path, nbytes):
+        self.path = path
+        self.nbytes = nbytes
+
+
+class RenderCache:
+    """Memory tier in front of a memory-mapped disk tier."""
+
+    def __init__(self, directory=RENDER_CACHE_DIR, memory_bytes=MEMORY_BYTES, disk_bytes=DISK_BYTES):
+        self.directory = directory
+        self.memory = ByteLRU(memory_bytes)
+        self.disk = ByteLRU(disk_bytes, on_evict=self._delete)
+        self._lock = threading.Lock()
+        self._scanned = False
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.npy")
+
+    @staticmethod
+    def _delete(key, entry):
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+    def _scan(self):
+        # Adopt what earlier runs left behind, least recently written first
+        with self._lock:
+            if self._scanned:
+                return
+            self._scanned = True
+        files = glob.glob(os.path.join(self.directory, "*.npy"))
+        for path in sorted(files, key=lambda p: os.stat(p).st_mtime if os.path.exists(p) else 0):
+            self._adopt(os.path.basename(path)[:-4], path)
+
+    def _adopt(self, key, path):
+        try:
+            entry = DiskEntry(path, os.path.getsize(path))
+        except OSError:
+            return None
+        self.disk.put(key, entry)
+        return entry
+
+    def get(self, key):
+        """The cached render for ``key`` as a read-only uint8 array, or ``None``."""
+        arr = self.memory.get(key)
+        if arr is not None or not self.disk.max_bytes:
+            return arr
+        self._scan()
+        entry = self.disk.get(key)
+        if entry is None and os.path.exists(self.path(key)):
+            entry = self._adopt(key, self.path(key))
+        if entry is None:
+            return None
+        try:
+            arr = np.load(entry.path, mmap_mode="r")
+        except (OSError, ValueError):
+            self.disk.pop(key)
+            return None
+        self.memory.put(key, arr)
+        return arr
+
+    def put(self, key, arr):
+        """Store a uint8 render in both tiers."""
+        arr = np.ascontiguousarray(arr, dtype=np.uint8)
+        arr.flags.writeable = False
+        self.memory.put(key, arr)
+        if not self.disk.max_bytes or arr.nbytes > self.disk.max_bytes:
+            return
+        self._scan()
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, arr)
+            os.replace(tmp, self.path(key))
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return
+        self._adopt(key, self.path(key))
+
+    def cached(self, key, render):
+        """PIL image for ``key``, calling ``render()`` and storing its result on a miss."""
+        arr = self.get(key)
+        if arr is not None:
+            return Image.fromarray(np.asarray(arr))
+        img = render()
+        self.put(key, np.asarray(img))
+        return img
+
+    def stats(self):
+        return {tier: {"entries": len(lru), "bytes": lru.nbytes, "max_bytes": lru.max_bytes,
+                       "hits": lru.hits, "misses": lru.misses, "evictions": lru.evictions}
+                for tier, lru in (("memory", self.memory), ("disk", self.disk))}
+
+
+RENDERS = RenderCache()
@@ -0,0 +1,126 @@
+# sources.py - Source artworks: bundled or uploaded, decoded as little as possible
+"""Encoded source images, cached by content hash, decoded on demand.
+
+A ``Source`` holds the encoded bytes and the header facts: size, format
+and EXIF orientation. Nothing is decoded on construction. ``preview``
+decodes at display width. For JPEG, draft mode lets libjpeg produce
+1/2, 1/4 or 1/8 scale pixels straight from the DCT coefficients, so a
+100-megapixel scan is never expanded for the preview. Only ``full``
+decodes every pixel, and only the export asks for it. Pillow cannot
+decode a region of a JPEG, so that decode is done in one piece.
+
+Sources are kept in a ``ByteLRU`` by content hash, shared by every session.
+A cheap caller hint, such as an upload id or a file's path and mtime,
+avoids rehashing the same bytes on every rerun.
+"""
+import hashlib
+import os
+import threading
+from io import BytesIO
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from .graph import ByteLRU
+from .preview import PREVIEW_WIDTH, make_proxy
+
+# Largest accepted image; Pillow refuses anything over twice this
+MAX_IMAGE_PIXELS = int(float(os.environ.get("SOPHISTICATED_PALETTE_MAX_IMAGE_PIXELS", "200e6")))
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+SOURCE_CACHE_BYTES = int(float(os.environ.get("SOPHISTICATED_PALETTE_SOURCE_CACHE_MB", "512")) * 2**20)
+UPLOAD_TYPES = ["jpg", "jpeg", "png", "webp", "tif", "tiff", "bmp"]
+
+# EXIF orientations that swap width and height
+_TRANSPOSED = (5, 6, 7, 8)
+_ORIENTATION = 0x0112
+
+
+class SourceError(ValueError):
+    """The bytes are not a readable image, or it is too large."""
+
+
+class Source:
+    """An encoded artwork; ``nbytes`` is the size of the encoded bytes."""
+
+    def __init__(self, data, key):
+        self.data = data
+        self.key = key
+        self.nbytes = len(data)
+        try:
+            with Image.open(BytesIO(data)) as img:
+                width, height = img.size
+                self.format = img.format
+                orientation = img.getexif().get(_ORIENTATION, 1)
+        except (Image.DecompressionBombError, OSError, SyntaxError) as e:
+            raise SourceError(str(e)) from None
+        if width * height > MAX_IMAGE_PIXELS:
+            raise SourceError(f"{width}x{height} is over the {MAX_IMAGE_PIXELS / 1e6:.0f} megapixel limit")
+        self.transposed = orientation in _TRANSPOSED
+        self.size = (height, width) if self.transposed else (width, height)
+
+    def open(self):
+        return Image.open(BytesIO(self.data))
+
+    def preview(self, width=PREVIEW_WIDTH):
+        """``(image, scale)`` at most ``width`` wide, decoded at reduced scale when possible."""
+        hit = _previews.get((self.key, width))
+        if hit is not None:
+            return Image.fromarray(hit), hit.shape[1] / self.size[0]
+
+        with self.open() as img:
+            if width < self.size[0]:
+                target = (width, max(1, round(self.size[1] * width / self.size[0])))
+                img.draft("RGB", target[::-1] if self.transposed else target)
+            img = ImageOps.exif_transpose(img).convert("RGB")
+        proxy, _ = make_proxy(img, width)
+        _previews.put((self.key, width), np.asarray(proxy))
+        return proxy, proxy.width / self.size[0]
+
+    def full(self):
+        """Every pixel, upright, as RGB; only exports need this."""
+        with self.open() as img:
+            return ImageOps.exif_transpose(img).convert("RGB")
+
+
+_sources = ByteLRU(SOURCE_CACHE_BYTES)
+# Decoded previews, uint8 arrays keyed by (content key, width)
+_previews = ByteLRU(SOURCE_CACHE_BYTES // 4)
+_hints = {}
+MAX_HINTS = 4096
+_hints_lock = threading.Lock()
+
+
+def content_key(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def load(data, hint=None):
+    """The cached ``Source`` for ``data``; ``hint`` skips hashing when seen before."""
+    with _hints_lock:
+        key = _hints.get(hint) if hint is not None else None
+    source = _sources.get(key) if key is not None else None
+    if source is not None:
+        return source
+    key = content_key(data)
+    source = _sources.get(key)
+    if source is None:
+        source = Source(data, key)
+        _sources.put(key, source)
+    if hint is not None:
+        with _hints_lock:
+            if len(_hints) >= MAX_HINTS:
+                _hints.clear()
+            _hints[hint] = key
+    return source
+
+def load_path(path):
+    """``load`` for a file, hinted by its path, size and modification time."""
+    stat = os.stat(path)
+    hint = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _hints_lock:
+        key = _hints.get(hint)
+    source = _sources.get(key) if key is not None else None
+    if source is not None:
+        return source
+    with open(path, "rb") as f:
+        return load(f.read(), hint)
@@ -0,0 +1,133 @@
+# styles.py - Neural style transfer with cached style embeddings
+"""Per-style reference images and bottleneck embeddings for style transfer.
+
+Magenta's arbitrary stylization model is two networks: a style-prediction
+network that turns a style image into a 100-d bottleneck embedding, and a
+transfer network that applies an embedding to a content image. A built-in
+style never changes, so its embedding is computed once, stored next to the
+reference image in ``STYLE_DIR`` (``SOPHISTICATED_PALETTE_STYLE_DIR``), and
+every later render runs only the transfer network.
+
+Reference images are downloaded one at a time, on first use, and kept in
+the same directory.
+"""
+import os
+import re
+import threading
+
+import numpy as np
+from PIL import Image
+
+from . import models
+
+STYLE_DIR = os.path.expanduser(os.environ.get(
+    "SOPHISTICATED_PALETTE_STYLE_DIR", os.path.join("~", ".cache", "sophisticated_palette", "styles")))
+
+# Long side of the stylized output, as with the original full-model path
+OUTPUT_SIZE = 512
+# Content side lengths are rounded to this, the transfer network's total stride
+CONTENT_MULTIPLE = 8
+# Longest content side, so panoramas do not blow up the transfer cost
+MAX_CONTENT_SIDE = 1024
+
+STYLES = {
+    "Starry Night (Van Gogh)": "https://upload.wikimedia.org/wikipedia/commons/thumb/e/ea/Van_Gogh_-_Starry_Night_-_Google_Art_Project.jpg/1280px-Van_Gogh_-_Starry_Night_-_Google_Art_Project.jpg",
+    "The Great Wave (Hokusai)": "https://upload.wikimedia.org/wikipedia/commons/thumb/a/a5/Tsunami_by_hokusai_19th_century.jpg/1280px-Tsunami_by_hokusai_19th_century.jpg",
+    "Da Vinci Sketch": "https://upload.wikimedia.org/wikipedia/commons/thumb/e/e5/Leonardo_da_vinci%2C_a_bear%27s_head.jpg/800px-Leonardo_da_vinci%2C_a_bear%27s_head.jpg",
+    "Cubism (Picasso)": "https://upload.wikimedia.org/wikipedia/en/1/1c/Pablo_Picasso%2C_1910%2C_Girl_with_a_Mandolin_%28Fanny_Tellier%29%2C_oil_on_canvas%2C_100.3_x_73.6_cm%2C_Museum_of_Modern_Art_New_York..jpg",
+    "Abstract Watercolor": "https://upload.wikimedia.org/wikipedia/commons/thumb/8/89/Wassily_Kandinsky%2C_1910_-_Untitled_%28First_Abstract_Watercolor%29.jpg/1280px-Wassily_Kandinsky%2C_1910_-_Untitled_%28First_Abstract_Watercolor%29.jpg",
+}
+
+_embeddings = {}
+_lock = threading.Lock()
+
+
+def slug(name):
+    return re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-")
+
+def load_style_image(name):
+    """Reference painting for ``name``, from the on-disk cache when possible."""
+    path = os.path.join(STYLE_DIR, slug(name) + ".jpg")
+    if not os.path.exists(path):
+        if models.OFFLINE:
+            raise models.ModelStoreError(f"Style image '{name}' is not cached and SOPHISTICATED_PALETTE_OFFLINE is set.")
+        os.makedirs(STYLE_DIR, exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(models.download(STYLES[name]))
+        os.replace(tmp, path)
+    return Image.open(path).convert("RGB")
+
+def to_model_input(img, size):
+    """Resize to ``size`` (width, height) and scale to a ``[1, h, w, 3]`` float batch in [0, 1]."""
+    arr = np.asarray(img.convert("RGB").resize(size, Image.BILINEAR), dtype=np.float32) / 255.0
+    return arr[np.newaxis, ...]
+
+def style_embedding(name):
+    """Bottleneck embedding of style ``name``, cached in memory and on disk."""
+    with _lock:
+        if name in _embeddings:
+            return _embeddings[name]
+        predictor_digest = models.read_manifest().get("style_predict", {}).get("sha256", "unpinned")[:12]
+        path = os.path.join(STYLE_DIR, f"{slug(name)}.{predictor_digest}.npy")
+        if os.path.exists(path):
+            embedding = np.load(path)
+        else:
+            predictor = models.load_style_predictor()
+            _, height, width, _ = predictor.input_shape()
+            embedding = predictor(to_model_input(load_style_image(name), (width, height)))
+            os.makedirs(STYLE_DIR, exist_ok=True)
+            np.save(path, embedding)
+        _embeddings[name] = embedding
+        return embedding
+
+def output_size(width, height, long_side=OUTPUT_SIZE):
+    scale = long_side / max(width, height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def content_size(transfer, content_at, width, height):
+    """Content input ``(width, height)`` keeping the image's aspect ratio.
+
+    The short side gets the model's native size (384 for Magenta's transfer
+    network), so strokes are not stretched as they were with a square input.
+    The long side is capped at ``MAX_CONTENT_SIDE``.
+    """
+    _, native_h, native_w, _ = transfer.native_shapes[content_at]
+    scale = min(min(native_h, native_w) / min(width, height), MAX_CONTENT_SIDE / max(width, height))
+    return tuple(max(CONTENT_MULTIPLE, round(n * scale / CONTENT_MULTIPLE) * CONTENT_MULTIPLE)
+                 for n in (width, height))
+
+def stylize(img_np, name):
+    """Restyle a uint8 RGB array with style ``name``; runs the transfer network only."""
+    transfer = models.load_style_transfer()
+    content_at = transfer.input_index(lambda shape: shape[-1] == 3)
+    size = content_size(transfer, content_at, img_np.shape[1], img_np.shape[0])
+
+    content = to_model_input(Image.fromarray(img_np), size)
+    embedding = style_embedding(name)
+    inputs = [None, None]
+    inputs[content_at], inputs[1 - content_at] = content, embedding
+    stylized = transfer(*inputs)[0]
+
+    return from_model_output(stylized, img_np.shape[1], img_np.shape[0])
+
+def from_model_output(stylized, width, height):
+    out = Image.fromarray(np.clip(stylized * 255, 0, 255).astype(np.uint8))
+    return np.array(out.resize(output_size(width, height), Image.BILINEAR))
+
+def stylize_many(img_np, names):
+    """One restyled array per style in ``names``, from a single batched transfer call.
+
+    The content image is preprocessed once and repeated along the batch
+    axis next to the stacked, cached embeddings.
+    """
+    transfer = models.load_style_transfer_batch()
+    content_at = transfer.input_index(lambda shape: shape[-1] == 3)
+    size = content_size(transfer, content_at, img_np.shape[1], img_np.shape[0])
+
+    content = to_model_input(Image.fromarray(img_np), size)
+    inputs = [None, None]
+    inputs[content_at] = np.repeat(content, len(names), axis=0)
+    inputs[1 - content_at] = np.concatenate([style_embedding(name) for name in names], axis=0)
+    stylized = transfer(*inputs)
+    return [from_model_output(out, img_np.shape[1], img_np.shape[0]) for out in stylized]
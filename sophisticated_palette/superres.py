@@ -0,0 +1,101 @@
+# superres.py - Tiled, memory-capped ESRGAN super-resolution
+"""Run the 4x ESRGAN model over overlapping tiles instead of the whole frame.
+
+Feeding a full 1449px painting to ESRGAN as one tensor needs several GB of
+activations. Here the image is cut into equal, overlapping tiles that are
+upscaled in batches; tile outputs are feathered across the overlap and
+accumulated one tile-row band at a time, so peak memory is set by the tile
+size and batch size rather than by the image.
+
+The batch size is derived from a peak-memory budget using an estimate of
+ESRGAN's activation footprint per input pixel.
+"""
+import os
+
+import numpy as np
+
+from . import models
+
+SCALE = 4
+TILE_SIZE = int(os.environ.get("SOPHISTICATED_PALETTE_SR_TILE", "128"))
+TILE_OVERLAP = int(os.environ.get("SOPHISTICATED_PALETTE_SR_OVERLAP", "16"))
+MEMORY_BUDGET_MB = float(os.environ.get("SOPHISTICATED_PALETTE_SR_MEMORY_MB", "1024"))
+
+# Rough peak activation bytes per input pixel: the RRDB trunk holds up to
+# 192 float32 channels at input resolution and the upsampler 64 channels at
+# 16x the pixel count.
+BYTES_PER_PIXEL = 8 * 1024
+
+
+def batch_size_for(tile, budget_mb=MEMORY_BUDGET_MB):
+    """Tiles per model call that fit in ``budget_mb``; never less than one."""
+    return max(1, int(budget_mb * 2**20 // (tile * tile * BYTES_PER_PIXEL)))
+
+def tile_starts(length, tile, stride):
+    """Start offsets covering ``[0, length)`` with tiles of ``tile``; the last tile ends flush."""
+    starts = list(range(0, max(length - tile, 0) + 1, stride))
+    if starts[-1] + tile < length:
+        starts.append(length - tile)
+    return starts
+
+def feather(length, overlap):
+    """1-D blending ramp rising over ``overlap`` samples at each end."""
+    if overlap <= 0:
+        return np.ones(length, dtype=np.float32)
+    ramp = np.minimum(np.arange(length) + 0.5, length - np.arange(length) - 0.5) / overlap
+    return np.clip(ramp, 1e-3, 1.0).astype(np.float32)
+
+def run_esrgan(batch):
+    """Upscale a float32 ``[n, h, w, 3]`` batch in [0, 1] with the stored ESRGAN model."""
+    import tensorflow as tf
+    return np.asarray(models.load_super_res_model()(tf.constant(batch)))
+
+def upscale(img_np, tile=TILE_SIZE, overlap=TILE_OVERLAP, budget_mb=MEMORY_BUDGET_MB,
+            progress=None, model=run_esrgan):
+    """Upscale a uint8 RGB array by ``SCALE`` in overlapping tiles.
+
+    ``progress(done, total)`` is called after every batch.
+    """
+    height, width = img_np.shape[:2]
+    tile = max(tile, 2 * overlap + 1)
+    pad_h, pad_w = max(0, tile - height), max(0, tile - width)
+    src = np.pad(img_np, ((0, pad_h), (0, pad_w), (0, 0)), mode="edge").astype(np.float32) / 255.0
+    src_h, src_w = src.shape[:2]
+
+    stride = tile - overlap
+    ys, xs = tile_starts(src_h, tile, stride), tile_starts(src_w, tile, stride)
+    batch = batch_size_for(tile, budget_mb)
+    total, done = len(ys) * len(xs), 0
+
+    out_tile = tile * SCALE
+    weight = np.outer(feather(out_tile, overlap * SCALE), feather(out_tile, overlap * SCALE))[..., None]
+    out = np.empty((src_h * SCALE, src_w * SCALE, 3), dtype=np.uint8)
+
+    # Accumulators for the band of output rows touched by the current tile row
+    acc = np.zeros((out_tile, src_w * SCALE, 3), dtype=np.float32)
+    wsum = np.zeros((out_tile, src_w * SCALE, 1), dtype=np.float32)
+
+    for row, y in enumerate(ys):
+        for i in range(0, len(xs), batch):
+            chunk = xs[i:i + batch]
+            tiles = np.stack([src[y:y + tile, x:x + tile] for x in chunk])
+            for x, up in zip(chunk, model(tiles)):
+                x0 = x * SCALE
+                acc[:, x0:x0 + out_tile] += up * weight
+                wsum[:, x0:x0 + out_tile] += weight
+            done += len(chunk)
+            if progress is not None:
+                progress(done, total)
+
+        # Rows above the next tile row are final; flush them and slide the band
+        y_out = y * SCALE
+        next_out = ys[row + 1] * SCALE if row + 1 < len(ys) else y_out + out_tile
+        final = next_out - y_out
+        band = acc[:final] / wsum[:final]
+        out[y_out:next_out] = np.clip(band * 255.0, 0, 255).astype(np.uint8)
+        acc[:out_tile - final] = acc[final:].copy()
+        wsum[:out_tile - final] = wsum[final:].copy()
+        acc[out_tile - final:] = 0
+        wsum[out_tile - final:] = 0
+
+    return out[:height * SCALE, :width * SCALE]